@@ -0,0 +1,222 @@
+"""Análises de ocupação sobre o histórico dos leitos (requer NumPy).
+
+O histórico de todos os leitos é convertido uma única vez em arrays de
+intervalos (leito, status, início, fim); as curvas de ocupação, histogramas e
+utilização por ala são calculados sobre esses arrays, sem laços em Python por
+transição. A previsão de leitos livres usa a distribuição histórica do tempo
+de permanência.
+
+Uso:
+    python analise.py [--arquivo leitos.json] [--dias 90] [--horas 12]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("analise.py requer NumPy. Instale com: pip install numpy") from None
+
+import sprint
+
+OCUPADO = sprint.STATUS_LEITO.index("Ocupado")
+
+# Limites (em horas) das faixas do histograma de duração de cada status
+FAIXAS_HORAS = (0, 1, 2, 4, 8, 12, 24, 48, 72, 168, 336, 720, np.inf)
+
+
+def _segundos(valor):
+    """Segundos desde 1970 de um timestamp do histórico (datetime ou texto ISO)."""
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return (valor - sprint._EPOCA) / sprint._SEGUNDO
+
+
+def _colunas_historico(historico):
+    """Timestamps (float64) e códigos do novo status (int8) de um histórico."""
+    if isinstance(historico, sprint.HistoricoColunar):
+        # Representação compacta: as colunas já são arrays, basta apontar para elas
+        return (np.frombuffer(historico._timestamps, dtype=np.float64),
+                np.frombuffer(historico._novos, dtype=np.int8))
+    entradas = list(historico)
+    timestamps = np.fromiter((_segundos(h["timestamp"]) for h in entradas), dtype=np.float64, count=len(entradas))
+    novos = np.fromiter((sprint._CODIGOS_STATUS.get(h.get("novo_status"), -1) for h in entradas),
+                        dtype=np.int8, count=len(entradas))
+    return timestamps, novos
+
+
+def _ala_padrao(numero):
+    """Ala de um leito: a unidade/ala do número hierárquico, ou "geral"."""
+    return sprint.fragmento_do_leito(numero) or "geral"
+
+
+class Intervalos:
+    """Períodos que cada leito passou em cada status, em arrays paralelos.
+
+    `leito` indexa `numeros`; `status` é o código em sprint.STATUS_LEITO;
+    `inicio` e `fim` estão em segundos desde 1970. O último período de cada
+    leito termina em `agora` e fica marcado em `aberto`.
+    """
+
+    def __init__(self, numeros, leito, status, inicio, fim, aberto, agora):
+        self.numeros = numeros
+        self.leito = leito
+        self.status = status
+        self.inicio = inicio
+        self.fim = fim
+        self.aberto = aberto
+        self.agora = agora
+
+    def __len__(self):
+        return len(self.inicio)
+
+    @property
+    def duracao(self):
+        return self.fim - self.inicio
+
+
+def intervalos(leitos, agora=None):
+    """Converte o histórico de todos os leitos em um objeto Intervalos."""
+    agora = _segundos(agora or datetime.now())
+    numeros, colunas_ts, colunas_status, tamanhos = [], [], [], []
+    for leito in leitos:
+        timestamps, novos = _colunas_historico(leito["historico"])
+        numeros.append(leito["numero"])
+        colunas_ts.append(timestamps)
+        colunas_status.append(novos)
+        tamanhos.append(len(timestamps))
+    tamanhos = np.array(tamanhos, dtype=np.int64)
+    if not tamanhos.sum():
+        vazio = np.empty(0)
+        return Intervalos(numeros, vazio.astype(np.int32), vazio.astype(np.int8), vazio, vazio,
+                          vazio.astype(bool), agora)
+
+    inicio = np.concatenate(colunas_ts)
+    status = np.concatenate(colunas_status)
+    leito = np.repeat(np.arange(len(numeros), dtype=np.int32), tamanhos)
+    # Cada período termina na transição seguinte do mesmo leito; o último, agora
+    fim = np.empty_like(inicio)
+    fim[:-1] = inicio[1:]
+    aberto = np.zeros(len(inicio), dtype=bool)
+    aberto[np.cumsum(tamanhos)[tamanhos > 0] - 1] = True
+    fim[aberto] = agora
+    validos = ~np.isnan(inicio) & ~np.isnan(fim) & (status >= 0)
+    return Intervalos(numeros, leito[validos], status[validos], inicio[validos], fim[validos],
+                      aberto[validos], agora)
+
+
+def curva_ocupacao(iv, inicio, fim, passo=timedelta(hours=1), status="Ocupado"):
+    """Quantos leitos estavam em `status` em cada instante de `inicio` a `fim`, a cada `passo`.
+
+    Retorna (instantes, quantidades): datetime64[s] e inteiros.
+    """
+    codigo = sprint._CODIGOS_STATUS[status]
+    selecao = iv.status == codigo
+    inicios = np.sort(iv.inicio[selecao])
+    fins = np.sort(iv.fim[selecao])
+    instantes = np.arange(_segundos(inicio), _segundos(fim), passo.total_seconds())
+    # Em cada instante: períodos já iniciados menos períodos já encerrados
+    quantidades = np.searchsorted(inicios, instantes, "right") - np.searchsorted(fins, instantes, "right")
+    return instantes.astype("datetime64[s]"), quantidades
+
+
+def histograma_duracoes(iv, faixas_horas=FAIXAS_HORAS, incluir_abertos=False):
+    """Histograma da duração (em horas) dos períodos em cada status.
+
+    Retorna {status: quantidades por faixa}; as faixas são `faixas_horas`.
+    Períodos ainda em andamento ficam de fora, salvo com incluir_abertos=True.
+    """
+    selecao = np.ones(len(iv), dtype=bool) if incluir_abertos else ~iv.aberto
+    horas = iv.duracao[selecao] / 3600
+    status = iv.status[selecao]
+    return {nome: np.histogram(horas[status == codigo], bins=faixas_horas)[0]
+            for codigo, nome in enumerate(sprint.STATUS_LEITO)}
+
+
+def utilizacao_por_ala(iv, inicio, fim, ala_de=_ala_padrao):
+    """Fração do tempo-leito ocupada em cada ala entre `inicio` e `fim`."""
+    inicio, fim = _segundos(inicio), _segundos(fim)
+    alas = [ala_de(numero) for numero in iv.numeros]
+    nomes, ala_do_leito = np.unique(np.array(alas), return_inverse=True)
+    selecao = iv.status == OCUPADO
+    tempo = np.clip(np.minimum(iv.fim[selecao], fim) - np.maximum(iv.inicio[selecao], inicio), 0, None)
+    ocupado = np.bincount(ala_do_leito[iv.leito[selecao]], weights=tempo, minlength=len(nomes))
+    disponivel = np.bincount(ala_do_leito, minlength=len(nomes)) * (fim - inicio)
+    return {str(nome): round(float(o / d), 4) if d else 0.0 for nome, o, d in zip(nomes, ocupado, disponivel)}
+
+
+def prever_leitos_livres(leitos, horas=12, agora=None, dias_admissoes=90, iv=None):
+    """Leitos livres esperados em cada uma das próximas `horas`.
+
+    Para cada leito ocupado, a chance de alta até a hora h é tirada da
+    distribuição histórica do tempo de permanência, dado o tempo que o paciente
+    já está internado: (S(t) - S(t + h)) / S(t), com S a fração de internações
+    que duraram mais que t. As admissões esperadas seguem a taxa média de
+    ocupações por hora nos últimos `dias_admissoes` dias.
+    """
+    agora = agora or datetime.now()
+    if iv is None:
+        iv = intervalos(leitos, agora)
+    internacoes = iv.status == OCUPADO
+    permanencias = np.sort(iv.duracao[internacoes & ~iv.aberto])
+
+    def sobrevivencia(t):
+        return 1 - np.searchsorted(permanencias, t, "right") / len(permanencias)
+
+    ocupados = sprint.leitos_ocupados(leitos)
+    decorrido = np.array([(agora - leito["entrada_ocupacao"]).total_seconds() for leito in ocupados])
+    janela = dias_admissoes * 86400
+    admissoes_hora = float(np.count_nonzero(internacoes & (iv.inicio >= iv.agora - janela))) / (janela / 3600)
+    livres = sprint.resumo_ocupacao(leitos)["livres"]
+
+    previsao = []
+    for h in range(1, horas + 1):
+        if len(permanencias) and len(decorrido):
+            atual = sobrevivencia(decorrido)
+            adiante = sobrevivencia(decorrido + h * 3600)
+            altas = float(np.sum(np.divide(atual - adiante, atual, out=np.zeros_like(atual), where=atual > 0)))
+        else:
+            altas = 0.0
+        admissoes = admissoes_hora * h
+        previsao.append({
+            "hora": (agora + timedelta(hours=h)).isoformat(timespec="minutes"),
+            "altas_esperadas": round(altas, 2),
+            "admissoes_esperadas": round(admissoes, 2),
+            "livres_esperados": round(max(0.0, livres + altas - admissoes), 2),
+        })
+    return previsao
+
+
+def relatorio(leitos, dias=90, horas=12, agora=None):
+    """Curva de ocupação por hora, durações, utilização por ala e previsão, prontos para JSON."""
+    agora = agora or datetime.now()
+    inicio = agora - timedelta(days=dias)
+    iv = intervalos(leitos, agora)
+    instantes, ocupados = curva_ocupacao(iv, inicio, agora)
+    return {
+        "transicoes": len(iv),
+        "ocupacao_por_hora": [{"hora": str(t), "ocupados": int(n)} for t, n in zip(instantes, ocupados)],
+        "duracao_horas": {"faixas": [str(f) for f in FAIXAS_HORAS],
+                          "por_status": {s: c.tolist() for s, c in histograma_duracoes(iv).items()}},
+        "utilizacao_por_ala": utilizacao_por_ala(iv, inicio, agora),
+        "previsao_livres": prever_leitos_livres(leitos, horas, agora, dias, iv),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análises de ocupação dos leitos.")
+    parser.add_argument("--arquivo", default="leitos.json")
+    parser.add_argument("--dias", type=int, default=90, help="período da curva de ocupação")
+    parser.add_argument("--horas", type=int, default=12, help="horizonte da previsão de leitos livres")
+    args = parser.parse_args()
+    with contextlib.redirect_stdout(io.StringIO()):
+        leitos = sprint.carregar_leitos(args.arquivo, compacto=True)
+    print(json.dumps(relatorio(leitos, args.dias, args.horas), indent=4, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,679 @@
+"""Medições de desempenho do sistema de leitos (sprint.py).
+
+Uso:
+    python benchmark.py operacoes [--leitos N [N ...]] [--historico N] [--amostras N] [--repeticoes N]
+                                  [--passadas N] [--compacto]
+                                  [--saida ARQUIVO] [--comparar ARQUIVO] [--tolerancia FRACAO]
+    python benchmark.py inicializacao [--leitos N] [--historico N]
+    python benchmark.py memoria [--leitos N] [--historico N]
+    python benchmark.py rede [--unidades N] [--alas N] [--leitos N] [--historico N]
+    python benchmark.py analise [--leitos N] [--historico N]
+    python benchmark.py concorrencia [--processos N] [--operacoes N] [--leitos N] [--arquivo CAMINHO]
+    python benchmark.py carga [--clientes N] [--requisicoes N] [--leitos N] [--url URL]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import sprint
+
+# Medições mínimas de cada tempo em `operacoes` (vale a menor); tempos curtos são
+# medidos mais vezes, até somarem DURACAO_MINIMA segundos
+REPETICOES = 5
+DURACAO_MINIMA = 0.1
+MAXIMO_MEDICOES = 1000
+# Passadas completas de `operacoes` por tamanho, alternando os tamanhos; vale a melhor
+# de cada métrica. Espalha as medições pela rodada, já que a velocidade da máquina
+# oscila por frações de segundo
+PASSADAS = 3
+
+PACIENTES_EXEMPLO = ["João Silva", "Maria Souza", "Ana Lima", "José Santos", "Antônio Pereira",
+                     "Francisca Costa", "Carlos Oliveira", "Paulo Rodrigues", "Lúcia Almeida", "Pedro Gomes"]
+
+
+def gerar_leitos(n_leitos, n_historico, semente=42):
+    """Gera uma lista sintética de leitos (dicionários) com `n_historico` transições cada.
+
+    As transições seguem o ciclo real de um leito (ocupar, liberar, limpar,
+    finalizar limpeza), com intervalos aleatórios entre elas.
+    """
+    aleatorio = random.Random(semente)
+    inicio = datetime(2024, 1, 1)
+    ciclo = [("Disponível", "Ocupado"), ("Ocupado", "Leito Pronto"),
+             ("Leito Pronto", "Em Limpeza"), ("Em Limpeza", "Leito Pronto")]
+    leitos = []
+    for numero in range(1, n_leitos + 1):
+        momento = inicio + timedelta(minutes=aleatorio.randrange(600))
+        historico = []
+        paciente = None
+        entrada = None
+        for i in range(n_historico):
+            anterior, novo = ciclo[i % len(ciclo)]
+            if i and anterior == "Disponível":
+                anterior = "Leito Pronto"
+            h = {"tipo": "mudanca_status", "status_anterior": anterior, "novo_status": novo, "timestamp": momento}
+            if novo == "Ocupado":
+                paciente = aleatorio.choice(PACIENTES_EXEMPLO)
+                entrada = momento
+                h["paciente"] = paciente
+            elif anterior == "Ocupado":
+                horas, resto = divmod(int((momento - entrada).total_seconds()), 3600)
+                h["paciente"] = paciente
+                h["tempo_permanencia"] = f"{horas}h {resto // 60}min"
+                paciente = entrada = None
+            historico.append(h)
+            momento += timedelta(minutes=aleatorio.randrange(30, 3000))
+        status = historico[-1]["novo_status"] if historico else "Disponível"
+        leitos.append({"numero": str(numero), "status": status, "paciente": paciente,
+                       "entrada_ocupacao": entrada, "historico": historico, "versao": n_historico})
+    return leitos
+
+
+def _memoria_de(construir):
+    """Memória (bytes) retida pelo objeto devolvido por `construir()`."""
+    gc.collect()
+    tracemalloc.start()
+    objeto = construir()
+    gc.collect()
+    usado, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objeto, usado
+
+
+def medir_memoria(n_leitos, n_historico):
+    """Compara a memória dos leitos em dicionários com a representação compacta (Leito)."""
+    json_leitos = json.dumps([sprint._serializar_leito(leito) for leito in gerar_leitos(n_leitos, n_historico)])
+
+    def carregar_dicionarios():
+        return sprint.RegistroLeitos(sprint._desserializar_leito(leito) for leito in json.loads(json_leitos))
+
+    dicionarios, memoria_dicionarios = _memoria_de(carregar_dicionarios)
+    del dicionarios
+    compactos, memoria_compacta = _memoria_de(lambda: sprint.compactar_leitos(carregar_dicionarios()))
+
+    # A representação compacta precisa voltar exatamente ao mesmo JSON
+    sem_perdas = json.dumps([sprint._serializar_leito(leito) for leito in compactos]) == json_leitos
+    return {
+        "leitos": n_leitos,
+        "historico_por_leito": n_historico,
+        "memoria_dicionarios_bytes": memoria_dicionarios,
+        "memoria_compacta_bytes": memoria_compacta,
+        "reducao": round(1 - memoria_compacta / memoria_dicionarios, 3),
+        "sem_perdas": sem_perdas,
+    }
+
+
+def _cronometrar(funcao, *args):
+    """Duração (s) de uma chamada, com a saída do terminal descartada.
+
+    Como no timeit, a coleta de lixo fica desligada durante a chamada: uma coleta
+    completa custa conforme tudo o que o processo tem em memória, não a operação.
+    """
+    coleta = gc.isenabled()
+    gc.disable()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao(*args)
+            return time.perf_counter() - inicio
+    finally:
+        if coleta:
+            gc.enable()
+
+
+def _medicoes_suficientes(duracoes, repeticoes):
+    return len(duracoes) >= repeticoes and (sum(duracoes) >= DURACAO_MINIMA or len(duracoes) >= MAXIMO_MEDICOES)
+
+
+def _melhor_tempo(funcao, repeticoes, preparar=None):
+    """Menor duração (s) entre várias chamadas de `funcao`: pelo menos `repeticoes`,
+    e mais enquanto não somarem DURACAO_MINIMA segundos.
+
+    A menor medição é a que menos sofreu com outros processos e com a coleta de
+    lixo; é ela que vai para os resultados e para a comparação entre rodadas.
+    Se houver `preparar`, ele roda antes de cada chamada, fora do tempo medido,
+    e o que devolver é passado como argumento para `funcao`.
+    """
+    duracoes = []
+    while not _medicoes_suficientes(duracoes, repeticoes):
+        argumento = () if preparar is None else (preparar(),)
+        duracoes.append(_cronometrar(funcao, *argumento))
+    return min(duracoes)
+
+
+def _limpar_linhas(leitos):
+    """Descarta as linhas de exibição guardadas, para medir a primeira exibição de uma tela."""
+    leitos._linhas = {}
+    leitos._historico_exibido = None
+
+
+def _pico_memoria(funcao, *args):
+    """Pico de memória (bytes) alocada durante uma chamada."""
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        funcao(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico
+
+
+def medir_operacoes(n_leitos, n_historico, n_amostras, compacto=False, semente=42, repeticoes=REPETICOES):
+    """Mede as operações de sprint.py sobre `n_leitos` leitos sintéticos.
+
+    Inclui a vazão de adição e de ocupação/liberação, a latência das buscas,
+    o tempo das telas visualizar_* (saída descartada) e o tempo, o tamanho e
+    o pico de memória de salvar_leitos()/carregar_leitos() em JSON. Cada tempo
+    é o menor de várias medições (ver _melhor_tempo), para uma rodada lenta
+    isolada não parecer uma regressão.
+    """
+    aleatorio = random.Random(semente)
+    resultado = {"leitos": n_leitos, "historico_por_leito": n_historico}
+
+    def registro_vazio():
+        vazio = sprint.RegistroLeitos()
+        vazio.compacto = compacto
+        return vazio
+
+    duracao = _melhor_tempo(lambda vazio: [sprint.adicionar_leito(vazio, str(numero))
+                                           for numero in range(1, n_leitos + 1)],
+                            repeticoes, registro_vazio)
+    resultado["adicionar_por_s"] = round(n_leitos / duracao, 1)
+
+    def registro_gerado():
+        leitos = sprint.RegistroLeitos(gerar_leitos(n_leitos, n_historico, semente))
+        if compacto:
+            sprint.compactar_leitos(leitos)
+        return leitos
+
+    leitos = registro_gerado()
+    livres = [leito["numero"] for leito in leitos if leito["status"] in sprint.TRANSICOES["ocupar"][0]]
+    alvos = aleatorio.sample(livres, min(n_amostras, len(livres)))
+    if alvos:
+        # A vazão é medida em uma cópia: cada rodada ocupa e libera os mesmos leitos (liberados, eles voltam a
+        # aceitar ocupação), e quantas rodadas cabem depende da máquina; o histórico medido depois não muda
+        rodadas = registro_gerado()
+        ocupar, liberar = [], []
+        while not _medicoes_suficientes(ocupar + liberar, repeticoes):
+            ocupar.append(_cronometrar(lambda: [sprint.ocupar_leito(rodadas, numero, "Paciente Benchmark")
+                                                for numero in alvos]))
+            liberar.append(_cronometrar(lambda: [sprint.liberar_leito(rodadas, numero) for numero in alvos]))
+        resultado["ocupar_por_s"] = round(len(alvos) / min(ocupar), 1)
+        resultado["liberar_por_s"] = round(len(alvos) / min(liberar), 1)
+        del rodadas
+
+        # As telas são medidas com os leitos ocupados, para visualizar_leitos_ocupados ter o que exibir:
+        # a primeira exibição (_s) sem linhas guardadas e a de um painel atualizado sem transições no meio
+        # (_atualizar_s)
+        _cronometrar(lambda: [sprint.ocupar_leito(leitos, numero, "Paciente Benchmark") for numero in alvos])
+        for tela in ("visualizar_leitos", "visualizar_leitos_ocupados", "visualizar_historico"):
+            funcao = getattr(sprint, tela)
+            resultado[f"{tela}_s"] = round(_melhor_tempo(lambda _: funcao(leitos), repeticoes,
+                                                         lambda: _limpar_linhas(leitos)), 6)
+            resultado[f"{tela}_atualizar_s"] = round(_melhor_tempo(funcao, repeticoes, lambda: leitos), 6)
+        _cronometrar(lambda: [sprint.liberar_leito(leitos, numero) for numero in alvos])
+        # Um paciente com poucas internações, para a busca por nome medir o índice e não a listagem
+        _cronometrar(sprint.ocupar_leito, leitos, alvos[0], "Zuleica Benchmark")
+
+    numeros = [str(aleatorio.randint(1, n_leitos)) for _ in range(n_amostras)]
+    duracao = _melhor_tempo(lambda: [sprint.encontrar_leito(leitos, numero) for numero in numeros], repeticoes)
+    resultado["encontrar_leito_us"] = round(duracao / len(numeros) * 1e6, 3)
+
+    def sem_indice():
+        leitos._pacientes = None
+
+    resultado["indice_pacientes_s"] = round(_melhor_tempo(lambda _: leitos.indice_pacientes(), repeticoes,
+                                                          sem_indice), 6)
+    # As consultas que buscar_leitos() faz para cada critério, sem o menu; uma chamada
+    # isolada dura microssegundos, então cada medição faz `vezes` chamadas seguidas
+    vezes = max(1, min(1000, n_amostras))
+    buscas = {"busca_numero_ms": (sprint.encontrar_leito, numeros[0]),
+              "busca_status_ms": (sprint.leitos_por_status, "Em Limpeza"),
+              "busca_paciente_ms": (sprint.buscar_pacientes, "zuleica")}
+    for metrica, (consulta, valor) in buscas.items():
+        duracao = _melhor_tempo(lambda: [consulta(leitos, valor) for _ in range(vezes)], repeticoes)
+        resultado[metrica] = round(duracao / vezes * 1000, 5)
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        arquivo = os.path.join(diretorio, "leitos.json")
+        resultado["salvar_s"] = round(_melhor_tempo(lambda: sprint.salvar_leitos(leitos, arquivo), repeticoes), 4)
+        resultado["arquivo_bytes"] = os.path.getsize(arquivo)
+        resultado["salvar_pico_bytes"] = _pico_memoria(sprint.salvar_leitos, leitos, arquivo)
+        del leitos
+
+        def sem_cache():
+            # Mede a carga do JSON, como na primeira abertura depois de uma gravação
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(sprint._caminho_cache(arquivo))
+
+        resultado["carregar_s"] = round(_melhor_tempo(lambda _: sprint.carregar_leitos(arquivo, compacto),
+                                                      repeticoes, sem_cache), 4)
+        resultado["carregar_pico_bytes"] = _pico_memoria(sprint.carregar_leitos, arquivo, compacto)
+    return resultado
+
+
+def _melhores(passadas):
+    """Junta os resultados de várias passadas de medir_operacoes(): o maior valor das
+    métricas "_por_s" e o menor das demais (as que não são tempos são iguais em todas)."""
+    return {nome: (max if nome.endswith("_por_s") else min)(passada[nome] for passada in passadas)
+            for nome in passadas[0]}
+
+
+def executar_suite(tamanhos, n_historico, n_amostras, compacto=False, repeticoes=REPETICOES, passadas=PASSADAS):
+    """Roda medir_operacoes() `passadas` vezes para cada tamanho e junta os melhores
+    resultados com dados do ambiente."""
+    medicoes = {str(n): [] for n in tamanhos}
+    for _ in range(passadas):
+        for n in tamanhos:
+            medicoes[str(n)].append(medir_operacoes(n, n_historico, n_amostras, compacto, repeticoes=repeticoes))
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "compacto": compacto,
+        "repeticoes": repeticoes,
+        "passadas": passadas,
+        "tamanhos": {tamanho: _melhores(resultados) for tamanho, resultados in medicoes.items()},
+    }
+
+
+def comparar_resultados(atual, base, tolerancia=0.25):
+    """Lista as métricas que pioraram mais que `tolerancia` em relação a `base`.
+
+    Métricas terminadas em "_por_s" são melhores quando maiores; as demais
+    (tempos, bytes) quando menores. Os valores comparados já são os melhores de
+    várias medições e passadas (ver _melhor_tempo e executar_suite), então a
+    tolerância cobre só o que sobra de ruído. Só são comparados tamanhos presentes nos dois.
+    """
+    regressoes = []
+    for tamanho, metricas in atual["tamanhos"].items():
+        anteriores = base.get("tamanhos", {}).get(tamanho, {})
+        for nome, valor in metricas.items():
+            anterior = anteriores.get(nome)
+            if nome in ("leitos", "historico_por_leito") or not anterior or not isinstance(valor, (int, float)):
+                continue
+            variacao = (anterior - valor) / anterior if nome.endswith("_por_s") else (valor - anterior) / anterior
+            if variacao > tolerancia:
+                regressoes.append({"leitos": int(tamanho), "metrica": nome, "base": anterior, "atual": valor,
+                                   "piora": round(variacao, 3)})
+    return regressoes
+
+
+def confirmar_regressoes(resultados, base, tolerancia, n_historico, n_amostras, compacto=False,
+                         repeticoes=REPETICOES, passadas=PASSADAS):
+    """Compara `resultados` com `base` e mede de novo os tamanhos com métricas piores.
+
+    As novas passadas entram nos resultados (vale a melhor de cada métrica) antes
+    da comparação final: uma rodada lenta passageira não se repete, uma regressão sim.
+    """
+    regressoes = comparar_resultados(resultados, base, tolerancia)
+    tamanhos = sorted({regressao["leitos"] for regressao in regressoes})
+    if tamanhos:
+        nova = executar_suite(tamanhos, n_historico, n_amostras, compacto, repeticoes, passadas)
+        for tamanho, metricas in nova["tamanhos"].items():
+            resultados["tamanhos"][tamanho] = _melhores([resultados["tamanhos"][tamanho], metricas])
+        regressoes = comparar_resultados(resultados, base, tolerancia)
+    return regressoes
+
+
+def _carregar_tudo(arquivo):
+    """Carga completa do JSON, convertendo todos os timestamps (como era feito antes do cache)."""
+    with open(arquivo, "r", encoding="utf-8") as f:
+        return sprint.RegistroLeitos(sprint._desserializar_leito(leito, arquivo) for leito in json.load(f))
+
+
+def medir_inicializacao(n_leitos, n_historico):
+    """Tempo para ter os leitos em memória na abertura do programa.
+
+    Compara a carga completa do JSON (todos os timestamps convertidos), a
+    primeira carga depois de o JSON mudar (que também gera o cache) e a carga
+    pelo cache binário. Também mede o custo de percorrer todo o histórico
+    depois da carga pelo cache, quando as conversões adiadas acontecem.
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        arquivo = os.path.join(diretorio, "leitos.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            sprint.salvar_leitos(sprint.RegistroLeitos(gerar_leitos(n_leitos, n_historico)), arquivo)
+        resultado = {"leitos": n_leitos, "historico_por_leito": n_historico,
+                     "arquivo_bytes": os.path.getsize(arquivo)}
+        resultado["json_completo_s"] = round(_cronometrar(_carregar_tudo, arquivo), 4)
+        resultado["sem_cache_s"] = round(_cronometrar(sprint.carregar_leitos, arquivo), 4)
+        resultado["cache_bytes"] = os.path.getsize(sprint._caminho_cache(arquivo))
+        resultado["com_cache_s"] = round(_cronometrar(sprint.carregar_leitos, arquivo), 4)
+        resultado["ganho"] = round(resultado["json_completo_s"] / resultado["com_cache_s"], 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            leitos = sprint.carregar_leitos(arquivo)
+        resultado["percorrer_historicos_s"] = round(
+            _cronometrar(lambda: [len(list(leito["historico"])) for leito in leitos]), 4)
+    return resultado
+
+
+def medir_rede(n_unidades, n_alas, n_leitos, n_historico):
+    """Rede fragmentada (um arquivo por ala) comparada a um único arquivo com todos os leitos.
+
+    `n_leitos` é o número de leitos por ala; os números seguem unidade/ala/leito.
+    """
+    leitos = gerar_leitos(n_unidades * n_alas * n_leitos, n_historico)
+    for posicao, leito in enumerate(leitos):
+        unidade, resto = divmod(posicao, n_alas * n_leitos)
+        ala, numero = divmod(resto, n_leitos)
+        leito["numero"] = f"HOSP{unidade + 1}/ALA{ala + 1}/{numero + 1}"
+    resultado = {"unidades": n_unidades, "alas_por_unidade": n_alas, "leitos_por_ala": n_leitos,
+                 "leitos": len(leitos)}
+    with tempfile.TemporaryDirectory() as diretorio:
+        unico = os.path.join(diretorio, "rede.json")
+        resultado["salvar_arquivo_unico_s"] = round(_cronometrar(sprint.salvar_leitos, sprint.RegistroLeitos(leitos), unico), 4)
+        resultado["carregar_arquivo_unico_s"] = round(_cronometrar(sprint._carregar_snapshot, unico), 4)
+
+        rede = sprint.RedeLeitos(os.path.join(diretorio, "rede"), diario=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for leito in leitos:
+                rede.fragmento_do_leito(leito["numero"]).adicionar(leito)
+        resultado["salvar_rede_s"] = round(_cronometrar(rede.salvar), 4)
+        um = sprint.fragmento_do_leito(leitos[0]["numero"])
+        resultado["salvar_um_fragmento_s"] = round(_cronometrar(rede.salvar, [um]), 4)
+        _cronometrar(rede.fechar)
+
+        rede = sprint.RedeLeitos(os.path.join(diretorio, "rede"), diario=False)
+        resultado["carregar_um_fragmento_s"] = round(_cronometrar(rede.fragmento, um), 4)
+        # Primeira consulta na rede inteira: carrega os demais fragmentos em paralelo
+        resultado["livres_rede_primeira_s"] = round(_cronometrar(rede.leitos_livres), 4)
+        resultado["livres_rede_s"] = round(_cronometrar(rede.leitos_livres), 4)
+        resultado["resumo_rede_s"] = round(_cronometrar(rede.resumo), 4)
+        rede._executor.shutdown()
+    return resultado
+
+
+def medir_analise(n_leitos, n_historico):
+    """Tempo das análises de analise.py (NumPy) sobre `n_leitos` x `n_historico` transições."""
+    import analise  # Só este subcomando depende de NumPy
+
+    leitos = sprint.RegistroLeitos(gerar_leitos(n_leitos, n_historico))
+    agora = max(h["timestamp"] for leito in leitos for h in leito["historico"][-1:])
+    resultado = {"leitos": n_leitos, "transicoes": n_leitos * n_historico}
+    inicio = time.perf_counter()
+    analise.intervalos(leitos, agora)
+    resultado["intervalos_dicionarios_s"] = round(time.perf_counter() - inicio, 4)
+    sprint.compactar_leitos(leitos)
+    inicio = time.perf_counter()
+    analise.intervalos(leitos, agora)
+    resultado["intervalos_compacto_s"] = round(time.perf_counter() - inicio, 4)
+    inicio = time.perf_counter()
+    analise.relatorio(leitos, 90, 12, agora)
+    resultado["relatorio_compacto_s"] = round(time.perf_counter() - inicio, 4)
+    return resultado
+
+
+def _operador(arquivo, n_operacoes, n_leitos, semente, resultados):
+    """Processo que simula um operador aplicando transições aleatórias no arquivo compartilhado."""
+    aleatorio = random.Random(semente)
+    contagem = {"sucesso": 0, "conflito": 0, "status_invalido": 0, "nao_encontrado": 0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        leitos = sprint.carregar_leitos(arquivo)
+        if leitos.banco is None:
+            sprint.ativar_diario(leitos, arquivo, limite_compactacao=200)
+        inicio = time.perf_counter()
+        for i in range(n_operacoes):
+            numero = str(aleatorio.randint(1, n_leitos))
+            acao = aleatorio.choice(list(sprint.TRANSICOES))
+            resultado = sprint.executar_transicao(leitos, numero, acao, f"Paciente {semente}-{i}")
+            contagem["sucesso" if resultado["sucesso"] else resultado["erro"]] += 1
+        duracao = time.perf_counter() - inicio
+    resultados.put((contagem, duracao))
+
+
+def _historico_consistente(leito):
+    """Confere se cada mudança de status parte do status deixado pela anterior."""
+    status = "Disponível"
+    for h in leito["historico"]:
+        if h["status_anterior"] != status:
+            return False
+        status = h["novo_status"]
+    return status == leito["status"]
+
+
+def medir_concorrencia(n_processos, n_operacoes, n_leitos, arquivo=None):
+    """Vários processos alterando o mesmo arquivo ao mesmo tempo.
+
+    Ao final, confere que nenhuma transição se perdeu (o total de entradas de
+    histórico é igual ao de transições aceitas) e que nenhum leito pulou de
+    estado (por exemplo, ocupado duas vezes seguidas).
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        arquivo = arquivo or os.path.join(diretorio, "leitos.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            leitos = sprint.carregar_leitos(arquivo)
+            for numero in range(1, n_leitos + 1):
+                sprint.adicionar_leito(leitos, str(numero))
+            sprint.salvar_leitos(leitos, arquivo)
+
+        resultados = multiprocessing.Queue()
+        processos = [multiprocessing.Process(target=_operador, args=(arquivo, n_operacoes, n_leitos, semente, resultados))
+                     for semente in range(n_processos)]
+        inicio = time.perf_counter()
+        for processo in processos:
+            processo.start()
+        coletados = [resultados.get() for _ in processos]
+        for processo in processos:
+            processo.join()
+        duracao = time.perf_counter() - inicio
+
+        contagem = {}
+        for parcial, _ in coletados:
+            for chave, valor in parcial.items():
+                contagem[chave] = contagem.get(chave, 0) + valor
+        with contextlib.redirect_stdout(io.StringIO()):
+            final = sprint.carregar_leitos(arquivo)
+        entradas = sum(len(leito["historico"]) for leito in final)
+        return {
+            "processos": n_processos,
+            "operacoes_por_processo": n_operacoes,
+            "leitos": n_leitos,
+            "duracao_s": round(duracao, 3),
+            "operacoes_por_s": round(n_processos * n_operacoes / duracao, 1),
+            "resultados": contagem,
+            "transicoes_gravadas": entradas,
+            "sem_perdas": entradas == contagem["sucesso"],
+            "historicos_consistentes": all(_historico_consistente(leito) for leito in final),
+        }
+
+
+async def _requisitar(leitor, escritor, metodo, caminho, dados=None):
+    """Envia uma requisição HTTP/1.1 (keep-alive) e devolve o código da resposta."""
+    corpo = json.dumps(dados).encode("utf-8") if dados is not None else b""
+    escritor.write(f"{metodo} {caminho} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(corpo)}\r\n\r\n"
+                   .encode("latin-1") + corpo)
+    await escritor.drain()
+    codigo = int((await leitor.readline()).split()[1])
+    tamanho = 0
+    while True:
+        linha = await leitor.readline()
+        if linha in (b"\r\n", b""):
+            break
+        if linha.lower().startswith(b"content-length:"):
+            tamanho = int(linha.split(b":")[1])
+    await leitor.readexactly(tamanho)
+    return codigo
+
+
+async def _cliente_carga(host, porta, n_requisicoes, n_leitos, semente, latencias, codigos):
+    """Cliente que mistura leituras (70%) e transições (30%) em uma conexão persistente."""
+    aleatorio = random.Random(semente)
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    try:
+        for i in range(n_requisicoes):
+            numero = aleatorio.randint(1, n_leitos)
+            sorteio = aleatorio.random()
+            if sorteio < 0.4:
+                pedido = ("GET", "/resumo", None)
+            elif sorteio < 0.7:
+                pedido = ("GET", f"/leitos/{numero}", None)
+            else:
+                acao = aleatorio.choice(list(sprint.TRANSICOES))
+                pedido = ("POST", f"/leitos/{numero}/{acao}", {"paciente": f"Paciente {semente}-{i}"})
+            inicio = time.perf_counter()
+            codigo = await _requisitar(leitor, escritor, *pedido)
+            latencias.append(time.perf_counter() - inicio)
+            codigos[codigo] = codigos.get(codigo, 0) + 1
+    finally:
+        escritor.close()
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def _disparar_carga(host, porta, n_clientes, n_requisicoes, n_leitos):
+    latencias, codigos = [], {}
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_cliente_carga(host, porta, n_requisicoes, n_leitos, semente, latencias, codigos)
+                           for semente in range(n_clientes)))
+    return time.perf_counter() - inicio, latencias, codigos
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_porta(host, porta, limite=10.0):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        with contextlib.suppress(OSError), socket.create_connection((host, porta), timeout=0.2):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"Servidor não respondeu em {host}:{porta}")
+
+
+def medir_carga(n_clientes, n_requisicoes, n_leitos, url=None):
+    """Teste de carga do servidor HTTP (servidor.py) em localhost.
+
+    Sem `url`, sobe um servidor próprio com `n_leitos` leitos em um arquivo
+    temporário e o encerra ao final.
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        processo = None
+        if url:
+            alvo = urlsplit(url)
+            host, porta = alvo.hostname, alvo.port or 80
+        else:
+            host, porta = "127.0.0.1", _porta_livre()
+            arquivo = os.path.join(diretorio, "leitos.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                leitos = sprint.carregar_leitos(arquivo)
+                for numero in range(1, n_leitos + 1):
+                    sprint.adicionar_leito(leitos, str(numero))
+                sprint.salvar_leitos(leitos, arquivo)
+            servidor = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py")
+            processo = subprocess.Popen([sys.executable, servidor, "--arquivo", arquivo, "--porta", str(porta),
+                                         "--silencioso"], stdout=subprocess.DEVNULL)
+        try:
+            _esperar_porta(host, porta)
+            duracao, latencias, codigos = asyncio.run(
+                _disparar_carga(host, porta, n_clientes, n_requisicoes, n_leitos))
+        finally:
+            if processo:
+                processo.terminate()
+                processo.wait(timeout=30)
+    return {
+        "clientes": n_clientes,
+        "requisicoes_por_cliente": n_requisicoes,
+        "duracao_s": round(duracao, 3),
+        "requisicoes_por_s": round(len(latencias) / duracao, 1),
+        "latencia_ms": {"p50": round(_percentil(latencias, 0.50) * 1000, 2),
+                        "p95": round(_percentil(latencias, 0.95) * 1000, 2),
+                        "p99": round(_percentil(latencias, 0.99) * 1000, 2)},
+        "codigos_http": {str(codigo): total for codigo, total in sorted(codigos.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do sistema de leitos.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    operacoes = subcomandos.add_parser("operacoes", help="vazão, latência, telas e persistência por tamanho")
+    operacoes.add_argument("--leitos", type=int, nargs="+", default=[100, 1000, 10000],
+                           help="tamanhos das populações de leitos (ex.: 100 1000 10000 100000)")
+    operacoes.add_argument("--historico", type=int, default=50, help="transições no histórico de cada leito")
+    operacoes.add_argument("--amostras", type=int, default=1000, help="operações por medição de vazão/latência")
+    operacoes.add_argument("--repeticoes", type=int, default=REPETICOES, help="medições mínimas de cada tempo (vale a menor)")
+    operacoes.add_argument("--passadas", type=int, default=PASSADAS,
+                           help="passadas completas por tamanho (vale a melhor de cada métrica)")
+    operacoes.add_argument("--compacto", action="store_true", help="usa a representação compacta (Leito)")
+    operacoes.add_argument("--saida", help="grava os resultados neste arquivo JSON")
+    operacoes.add_argument("--comparar", help="resultados anteriores (JSON) para apontar regressões")
+    operacoes.add_argument("--tolerancia", type=float, default=0.25, help="piora aceita antes de acusar regressão")
+    memoria = subcomandos.add_parser("memoria", help="memória: dicionários x representação compacta")
+    memoria.add_argument("--leitos", type=int, default=1000)
+    memoria.add_argument("--historico", type=int, default=200)
+    inicializacao = subcomandos.add_parser("inicializacao", help="tempo de carga: JSON completo x cache binário")
+    inicializacao.add_argument("--leitos", type=int, default=10000)
+    inicializacao.add_argument("--historico", type=int, default=100)
+    rede = subcomandos.add_parser("rede", help="rede fragmentada por ala x arquivo único")
+    rede.add_argument("--unidades", type=int, default=4)
+    rede.add_argument("--alas", type=int, default=10)
+    rede.add_argument("--leitos", type=int, default=250, help="leitos por ala")
+    rede.add_argument("--historico", type=int, default=20)
+    analise = subcomandos.add_parser("analise", help="tempo das análises de ocupação (requer NumPy)")
+    analise.add_argument("--leitos", type=int, default=10000)
+    analise.add_argument("--historico", type=int, default=200)
+    concorrencia = subcomandos.add_parser("concorrencia", help="vários processos no mesmo arquivo de dados")
+    concorrencia.add_argument("--processos", type=int, default=8)
+    concorrencia.add_argument("--operacoes", type=int, default=200)
+    concorrencia.add_argument("--leitos", type=int, default=20)
+    concorrencia.add_argument("--arquivo", help="arquivo de dados (.json ou .db); padrão: temporário .json")
+    carga = subcomandos.add_parser("carga", help="teste de carga do servidor HTTP em localhost")
+    carga.add_argument("--clientes", type=int, default=50)
+    carga.add_argument("--requisicoes", type=int, default=200)
+    carga.add_argument("--leitos", type=int, default=100)
+    carga.add_argument("--url", help="servidor já em execução (padrão: sobe um temporário)")
+    args = parser.parse_args()
+
+    if args.comando == "operacoes":
+        resultados = executar_suite(args.leitos, args.historico, args.amostras, args.compacto, args.repeticoes,
+                                    args.passadas)
+        if args.comparar:
+            with open(args.comparar, "r", encoding="utf-8") as f:
+                base = json.load(f)
+            resultados["regressoes"] = confirmar_regressoes(resultados, base, args.tolerancia, args.historico,
+                                                            args.amostras, args.compacto, args.repeticoes,
+                                                            args.passadas)
+        if args.saida:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                json.dump(resultados, f, indent=4, ensure_ascii=False)
+        print(json.dumps(resultados, indent=4, ensure_ascii=False))
+        if resultados.get("regressoes"):
+            sys.exit(1)
+    elif args.comando == "memoria":
+        print(json.dumps(medir_memoria(args.leitos, args.historico), indent=4))
+    elif args.comando == "inicializacao":
+        print(json.dumps(medir_inicializacao(args.leitos, args.historico), indent=4))
+    elif args.comando == "rede":
+        print(json.dumps(medir_rede(args.unidades, args.alas, args.leitos, args.historico), indent=4))
+    elif args.comando == "analise":
+        print(json.dumps(medir_analise(args.leitos, args.historico), indent=4))
+    elif args.comando == "concorrencia":
+        print(json.dumps(medir_concorrencia(args.processos, args.operacoes, args.leitos, args.arquivo), indent=4))
+    elif args.comando == "carga":
+        print(json.dumps(medir_carga(args.clientes, args.requisicoes, args.leitos, args.url), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Modo de comandos (não interativo) para scripts e automação.
+
+Cada comando executa uma operação sobre os leitos, com as mesmas funções do
+menu de sprint.py, e escreve o resultado como uma linha JSON na saída padrão,
+sem menus nem perguntas. As mensagens de sprint.py são descartadas (ou vão
+para a saída de erros, com --verboso).
+
+Credenciais: --token usuario:senha (ou a variável SPRINT_TOKEN), ou as
+variáveis SPRINT_USUARIO e SPRINT_SENHA. Pacientes só podem buscar, consultar
+e exportar o histórico.
+
+Sem --stdin-batch, o comando é gravado no diário de eventos (ou no banco
+SQLite), sem regravar o arquivo inteiro. Com --stdin-batch, cada linha da
+entrada padrão é um comando, com a mesma sintaxe da linha de comando: todos
+rodam no mesmo processo, com uma única carga e uma única transação, e os
+leitos são salvos uma vez ao final. A entrada é lida inteira antes de obter a
+trava e os resultados são escritos depois de liberá-la, então um pipe lento
+não bloqueia os demais operadores. Linhas vazias e começadas por "#" são
+ignoradas; cada resultado traz o número da "linha".
+
+Uso:
+    python comandos.py [--data leitos.json] [--token usuario:senha] [--verboso] <comando> [argumentos]
+    python comandos.py [--data leitos.json] [--token usuario:senha] --stdin-batch < comandos.txt
+
+Com --historico separado (ou SPRINT_HISTORICO_SEPARADO=1), os snapshots JSON
+gravados pelo processo guardam o histórico em arquivos por leito; --historico
+embutido volta ao arquivo único.
+
+Comandos (nome em inglês entre parênteses):
+    adicionar NUMERO                                   (add)
+    remover NUMERO                                     (remove)
+    ocupar NUMERO PACIENTE [--versao N]                (occupy)
+    liberar NUMERO [--versao N]                        (release)
+    iniciar_limpeza NUMERO [--versao N]                (clean-start)
+    finalizar_limpeza NUMERO [--versao N]              (clean-finish)
+    iniciar_manutencao NUMERO [--versao N]             (maintenance-start)
+    finalizar_manutencao NUMERO [--versao N]           (maintenance-finish)
+    buscar --status S | --paciente P | --numero N [--inicio ISO] [--fim ISO]
+                                                       (search)
+    historico [--numero N] [--inicio ISO] [--fim ISO] [--arquivado]
+                                                       (history)
+    exportar DESTINO.csv [--numero N] [--inicio ISO] [--fim ISO] [--arquivado]
+                                                       (export)
+
+Código de saída: 0 se todos os comandos deram certo, 1 se algum falhou e 2
+para uso inválido ou credenciais recusadas.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shlex
+import sys
+from datetime import datetime
+
+import sprint
+
+# Nome de cada comando em inglês, aceito como alternativa
+ALIASES = {
+    "adicionar": "add",
+    "remover": "remove",
+    "ocupar": "occupy",
+    "liberar": "release",
+    "iniciar_limpeza": "clean-start",
+    "finalizar_limpeza": "clean-finish",
+    "iniciar_manutencao": "maintenance-start",
+    "finalizar_manutencao": "maintenance-finish",
+    "buscar": "search",
+    "historico": "history",
+    "exportar": "export",
+}
+
+# Comandos que não alteram os leitos (os únicos permitidos a pacientes)
+SOMENTE_LEITURA = ("buscar", "historico", "exportar")
+
+
+class _ParserLinha(argparse.ArgumentParser):
+    """Parser das linhas de --stdin-batch: um erro vira o resultado da linha, sem encerrar o lote."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _data(texto):
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida: {texto!r} (use ISO 8601)") from None
+
+
+def _adicionar_comandos(parser):
+    comandos = parser.add_subparsers(dest="comando", metavar="comando")
+    for nome in ("adicionar", "remover"):
+        sub = comandos.add_parser(nome, aliases=[ALIASES[nome]], help=f"{nome} um leito")
+        sub.add_argument("numero")
+        sub.set_defaults(operacao=nome)
+    for acao in sprint.TRANSICOES:
+        sub = comandos.add_parser(acao, aliases=[ALIASES[acao]], help=acao.replace("_", " "))
+        sub.add_argument("numero")
+        if acao == "ocupar":
+            sub.add_argument("paciente")
+        sub.add_argument("--versao", type=int, help="recusa a operação se o leito estiver em outra versão")
+        sub.set_defaults(operacao=acao)
+
+    sub = comandos.add_parser("buscar", aliases=[ALIASES["buscar"]], help="busca leitos ou internações")
+    criterio = sub.add_mutually_exclusive_group(required=True)
+    criterio.add_argument("--status")
+    criterio.add_argument("--paciente", help="internações atuais e anteriores (sem acentos ou maiúsculas)")
+    criterio.add_argument("--numero")
+    sub.add_argument("--inicio", type=_data, help="com --paciente: internações a partir desta data")
+    sub.add_argument("--fim", type=_data, help="com --paciente: internações até esta data")
+    sub.set_defaults(operacao="buscar")
+
+    for nome, ajuda in (("historico", "mudanças de status no período"), ("exportar", "exporta o histórico em CSV")):
+        sub = comandos.add_parser(nome, aliases=[ALIASES[nome]], help=ajuda)
+        if nome == "exportar":
+            sub.add_argument("destino")
+        sub.add_argument("--numero")
+        sub.add_argument("--inicio", type=_data)
+        sub.add_argument("--fim", type=_data)
+        sub.add_argument("--arquivado", action="store_true", help="inclui o arquivo morto")
+        sub.set_defaults(operacao=nome)
+    return comandos
+
+
+def _falha(erro, mensagem):
+    return {"sucesso": False, "erro": erro, "mensagem": mensagem}
+
+
+def autenticar(token=None):
+    """Tipo de usuário ('enfermeiro' ou 'paciente') das credenciais, ou None se recusadas.
+
+    O token tem o formato "usuario:senha"; sem ele, valem SPRINT_TOKEN ou
+    SPRINT_USUARIO e SPRINT_SENHA.
+    """
+    token = token or os.environ.get("SPRINT_TOKEN")
+    if token:
+        usuario, _, senha = token.partition(":")
+    else:
+        usuario, senha = os.environ.get("SPRINT_USUARIO", ""), os.environ.get("SPRINT_SENHA", "")
+    for tipo in ("enfermeiro", "paciente"):
+        if sprint.credenciais_validas(tipo, usuario.strip(), senha.strip()):
+            return tipo
+    return None
+
+
+def executar(leitos, args, tipo):
+    """Executa um comando já interpretado e devolve o resultado, pronto para JSON."""
+    operacao = args.operacao
+    if tipo != "enfermeiro" and operacao not in SOMENTE_LEITURA:
+        return _falha("sem_permissao", f"Pacientes não podem executar '{operacao}'.")
+
+    if operacao == "adicionar":
+        numero = args.numero.strip()
+        if not sprint.numero_valido(numero):
+            return _falha("numero_invalido", sprint.MENSAGEM_NUMERO_INVALIDO)
+        if not sprint.adicionar_leito(leitos, numero):
+            return _falha("ja_existe", f"Leito {numero} já existe.")
+        return {"sucesso": True, "leito": sprint.leito_para_json(sprint.encontrar_leito(leitos, numero))}
+
+    if operacao == "remover":
+        numero = args.numero.strip()
+        leito = sprint.encontrar_leito(leitos, numero)
+        if not leito:
+            return _falha("nao_encontrado", f"Leito {numero} não encontrado.")
+        if not sprint.remover_leito(leitos, numero, confirmar=False):
+            return _falha("status_invalido", f"Leito {numero} está ocupado. Libere-o antes de remover.")
+        return {"sucesso": True, "removido": numero}
+
+    if operacao in sprint.TRANSICOES:
+        paciente = getattr(args, "paciente", None)
+        if operacao == "ocupar" and not paciente.strip():
+            return _falha("paciente_ausente", "Informe o nome do paciente.")
+        resultado = sprint.executar_transicao(leitos, args.numero, operacao, paciente and paciente.strip(),
+                                              args.versao)
+        if resultado["sucesso"]:
+            resultado["leito"] = sprint.leito_para_json(sprint.encontrar_leito(leitos, args.numero.strip()))
+        return resultado
+
+    if operacao == "buscar":
+        if args.paciente is not None:
+            return {"sucesso": True, "internacoes": [
+                {"paciente": e["paciente"], "numero": e["numero"],
+                 "inicio": e["inicio"].isoformat() if e["inicio"] else None,
+                 "fim": e["fim"].isoformat() if e["fim"] else None}
+                for e in sprint.buscar_pacientes(leitos, args.paciente, args.inicio, args.fim)]}
+        if args.status is not None:
+            encontrados = sprint.leitos_por_status(leitos, args.status.strip())
+        else:
+            leito = sprint.encontrar_leito(leitos, args.numero.strip())
+            encontrados = [leito] if leito else []
+        return {"sucesso": True, "leitos": [sprint.leito_para_json(leito) for leito in encontrados]}
+
+    if operacao == "historico":
+        pares = sprint.historico_por_periodo(leitos, args.inicio or datetime.min, args.fim or datetime.max,
+                                             args.numero, args.arquivado)
+        return {"sucesso": True, "historico": [dict(sprint._serializar_historico(h), numero=n) for n, h in pares]}
+
+    # exportar
+    exportadas = sprint.exportar_historico(leitos, args.destino, args.inicio, args.fim, args.numero, args.arquivado)
+    return {"sucesso": True, "exportadas": exportadas, "arquivo": args.destino}
+
+
+def _executar_protegido(leitos, args, tipo):
+    try:
+        return executar(leitos, args, tipo)
+    except Exception as e:
+        sprint._registrar_erro("comandos", e)
+        return _falha("erro_inesperado", f"Ocorreu um erro inesperado: {e}")
+
+
+def executar_lote(leitos, entrada, tipo, saida):
+    """Executa os comandos de `entrada` (um por linha), escrevendo uma linha JSON por
+    comando em `saida`. Retorna quantos comandos falharam."""
+    parser = _ParserLinha(prog="", add_help=False)
+    _adicionar_comandos(parser)
+    falhas = 0
+    for numero_linha, linha in enumerate(entrada, 1):
+        linha = linha.strip()
+        if not linha or linha.startswith("#"):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(linha))
+            if args.comando is None:
+                raise ValueError("informe um comando")
+        except ValueError as e:
+            resultado = _falha("comando_invalido", str(e))
+        else:
+            resultado = _executar_protegido(leitos, args, tipo)
+        resultado["linha"] = numero_linha
+        falhas += not resultado["sucesso"]
+        saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    return falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Operações de leitos sem menu, com saída em JSON.")
+    parser.add_argument("--data", default="leitos.json", help="arquivo dos leitos (.json ou .db)")
+    parser.add_argument("--token", help='credenciais "usuario:senha" (padrão: SPRINT_TOKEN ou '
+                                        'SPRINT_USUARIO/SPRINT_SENHA)')
+    parser.add_argument("--stdin-batch", action="store_true", help="lê um comando por linha da entrada padrão")
+    parser.add_argument("--verboso", action="store_true", help="mostra as mensagens das operações na saída de erros")
+    parser.add_argument("--historico", choices=sprint.FORMATOS_HISTORICO,
+                        help="formato dos snapshots JSON: histórico em arquivos por leito ou no arquivo principal "
+                             "(padrão: SPRINT_HISTORICO_SEPARADO ou o formato carregado)")
+    _adicionar_comandos(parser)
+    args = parser.parse_args(argv)
+    if args.stdin_batch == (args.comando is not None):
+        parser.error("informe um comando ou --stdin-batch")
+
+    saida = sys.stdout
+    tipo = autenticar(args.token)
+    if tipo is None:
+        saida.write(json.dumps(_falha("credenciais_invalidas", "Nome de usuário ou senha inválidos."),
+                               ensure_ascii=False) + "\n")
+        return 2
+
+    with contextlib.ExitStack() as pilha:
+        mensagens = sys.stderr if args.verboso else pilha.enter_context(open(os.devnull, "w", encoding="utf-8"))
+        pilha.enter_context(contextlib.redirect_stdout(mensagens))
+        leitos = sprint.carregar_leitos(args.data)
+        sprint.escolher_historico_separado(leitos, sprint.FORMATOS_HISTORICO.get(args.historico))
+        if leitos.banco is None:
+            # Cada alteração fica no diário; outros processos (menu, serviço) a enxergam
+            sprint.ativar_diario(leitos, args.data)
+        if args.stdin_batch:
+            # A trava só é obtida com o lote inteiro em mãos e liberada antes de escrever os resultados
+            linhas, resultados = sys.stdin.readlines(), io.StringIO()
+            with sprint._transacao(leitos):
+                falhas = executar_lote(leitos, linhas, tipo, resultados)
+                if leitos.banco is None:
+                    # Ainda dentro da transação: os eventos do lote vão direto para o
+                    # snapshot, sem passar pelo diário (no SQLite, um único COMMIT)
+                    sprint.salvar_leitos(leitos, args.data)
+            saida.write(resultados.getvalue())
+        else:
+            resultado = _executar_protegido(leitos, args, tipo)
+            falhas = not resultado["sucesso"]
+            saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
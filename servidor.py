@@ -0,0 +1,420 @@
+"""Serviço HTTP/JSON para as operações de leitos (somente biblioteca padrão).
+
+Mantém os leitos em memória, com o armazenamento durável de sprint.py por trás
+(diário de eventos para .json, transações para .db). As conexões são atendidas
+por asyncio; as operações sobre os leitos rodam, uma de cada vez, em uma única
+thread de trabalho, para que a gravação em disco (fsync) não bloqueie o laço.
+As alterações feitas por outros processos (menu, comandos.py) são lidas antes
+de cada consulta e a cada segundo, e também seguem para /eventos.
+
+Uso:
+    python servidor.py [--arquivo leitos.json] [--host 127.0.0.1] [--porta 8080] [--silencioso]
+                       [--historico separado|embutido]
+                       [--metricas] [--metricas-json metricas.json] [--metricas-intervalo 60]
+
+Rotas:
+    GET    /resumo                              contagem de leitos por status
+    GET    /leitos[?status=...]                 lista de leitos
+    POST   /leitos                {"numero"}    adiciona um leito
+    GET    /leitos/<numero>                     um leito ("/" de números hierárquicos como %2F)
+    DELETE /leitos/<numero>                     remove um leito
+    POST   /leitos/<numero>/<acao> {"paciente", "versao"}
+                                                ocupar, liberar, iniciar_limpeza, finalizar_limpeza,
+                                                iniciar_manutencao, finalizar_manutencao
+    GET    /leitos/<numero>/historico           histórico do leito
+    POST   /lote {"operacoes": [{"numero", "acao", "paciente", "versao"}, ...], "tudo_ou_nada"}
+                                                várias transições gravadas de uma vez
+    GET    /busca?status=...|paciente=...       busca de leitos
+    GET    /pacientes?nome=...[&inicio=...&fim=...]
+                                                internações atuais e anteriores do paciente
+    GET    /historico?inicio=...&fim=...[&numero=...][&arquivado=1]
+                                                mudanças de status no período (ISO 8601); com
+                                                arquivado=1, inclui o arquivo morto
+    POST   /arquivar {"dias", "maximo"}         move o histórico antigo para o arquivo morto
+    GET    /metrics                             métricas no formato texto do Prometheus (com --metricas)
+    GET    /eventos[?status=...&ala=...]        Server-Sent Events com cada mudança dos leitos; status e
+                                                ala podem se repetir; retoma após o cabeçalho Last-Event-ID
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import sprint
+
+MOTIVOS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 500: "Internal Server Error"}
+
+# Eventos guardados por assinante de /eventos antes de descartar os mais antigos
+LIMITE_FILA_EVENTOS = 256
+# Segundos sem eventos até enviar um comentário que mantém a conexão de /eventos aberta
+INTERVALO_PULSO = 15
+# Segundos entre as leituras do que outros processos (menu, comandos.py) gravaram
+INTERVALO_SINCRONIZACAO = 1
+
+# Código HTTP para cada erro devolvido por sprint.executar_transicao
+CODIGOS_ERRO = {"nao_encontrado": 404, "status_invalido": 409, "conflito": 409}
+
+
+class Texto(str):
+    """Corpo de resposta em texto puro (formato de exposição do Prometheus) em vez de JSON."""
+
+
+class ErroHTTP(Exception):
+    def __init__(self, codigo, mensagem):
+        super().__init__(mensagem)
+        self.codigo = codigo
+        self.mensagem = mensagem
+
+
+def _data(parametros, nome):
+    try:
+        return datetime.fromisoformat(parametros[nome][0])
+    except (KeyError, ValueError):
+        raise ErroHTTP(400, f"Parâmetro '{nome}' ausente ou inválido (use ISO 8601).")
+
+
+class ServicoLeitos:
+    """Operações de leitos expostas como funções que devolvem (código HTTP, corpo JSON)."""
+
+    def __init__(self, arquivo="leitos.json", silencioso=False, historico_separado=None):
+        self.arquivo = arquivo
+        self._saida = io.StringIO() if silencioso else sys.stdout
+        # Uma única thread: as operações ficam serializadas e fora do laço de eventos
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leitos")
+        with self._redirecionar():
+            self.leitos = sprint.carregar_leitos(arquivo)
+            sprint.escolher_historico_separado(self.leitos, historico_separado)
+            if self.leitos.banco is None:
+                sprint.ativar_diario(self.leitos, arquivo)
+        self.eventos = sprint.BarramentoEventos()
+        self.leitos.inscrever(self.eventos)
+
+    def _redirecionar(self):
+        if self._saida is sys.stdout:
+            return contextlib.nullcontext()
+        self._saida.seek(0)
+        self._saida.truncate()
+        return contextlib.redirect_stdout(self._saida)
+
+    async def executar(self, metodo, caminho, consulta, corpo):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._despachar, metodo, caminho, consulta, corpo)
+
+    async def sincronizar_periodicamente(self, intervalo=INTERVALO_SINCRONIZACAO):
+        """Traz as alterações de outros processos a cada `intervalo` segundos, para que
+        cheguem a /eventos mesmo quando este serviço não grava nada."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(intervalo)
+            await loop.run_in_executor(self._executor, self._sincronizar)
+
+    def _sincronizar(self):
+        try:
+            with self._redirecionar():
+                self.leitos.sincronizar()
+        except Exception as e:
+            sprint._registrar_erro("sincronizar", e)
+
+    def encerrar(self):
+        self._executor.shutdown(wait=True)
+        with self._redirecionar():
+            sprint.salvar_leitos(self.leitos, self.arquivo)
+
+    def _despachar(self, metodo, caminho, consulta, corpo):
+        partes = [unquote(parte) for parte in caminho.strip("/").split("/") if parte]
+        parametros = parse_qs(consulta)
+        try:
+            with self._redirecionar():
+                if metodo == "GET":
+                    # Leituras refletem o que outros processos gravaram (escritas já sincronizam na transação)
+                    self.leitos.sincronizar()
+                return self._rota(metodo, partes, parametros, corpo)
+        except ErroHTTP as e:
+            return e.codigo, {"erro": e.mensagem}
+        except Exception as e:
+            return 500, {"erro": f"Ocorreu um erro inesperado: {e}"}
+
+    def _rota(self, metodo, partes, parametros, corpo):
+        if partes == ["resumo"] and metodo == "GET":
+            return 200, sprint.resumo_ocupacao(self.leitos)
+        if partes == ["metrics"] and metodo == "GET":
+            if sprint.METRICAS is None:
+                raise ErroHTTP(404, "Métricas desligadas (inicie o serviço com --metricas).")
+            return 200, Texto(sprint.METRICAS.prometheus())
+        if partes == ["busca"] and metodo == "GET":
+            return 200, [sprint.leito_para_json(leito) for leito in self._buscar(parametros)]
+        if partes == ["pacientes"] and metodo == "GET":
+            nome = parametros.get("nome", [""])[0]
+            if not nome.strip():
+                raise ErroHTTP(400, "Parâmetro 'nome' obrigatório.")
+            inicio = _data(parametros, "inicio") if "inicio" in parametros else None
+            fim = _data(parametros, "fim") if "fim" in parametros else None
+            return 200, [{"paciente": e["paciente"], "numero": e["numero"],
+                          "inicio": e["inicio"].isoformat() if e["inicio"] else None,
+                          "fim": e["fim"].isoformat() if e["fim"] else None}
+                         for e in sprint.buscar_pacientes(self.leitos, nome, inicio, fim)]
+        if partes == ["historico"] and metodo == "GET":
+            numero = parametros.get("numero", [None])[0]
+            arquivado = parametros.get("arquivado", ["0"])[0] not in ("0", "", "false")
+            pares = sprint.historico_por_periodo(self.leitos, _data(parametros, "inicio"), _data(parametros, "fim"), numero,
+                                                 arquivado)
+            return 200, [dict(sprint._serializar_historico(h), numero=n) for n, h in pares]
+        if partes == ["arquivar"] and metodo == "POST":
+            dias, maximo = corpo.get("dias"), corpo.get("maximo")
+            if dias is None and maximo is None:
+                raise ErroHTTP(400, "Informe 'dias' e/ou 'maximo'.")
+            if not all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0)
+                       for v in (dias, maximo)):
+                raise ErroHTTP(400, "'dias' e 'maximo' devem ser números não negativos.")
+            return 200, {"arquivadas": sprint.arquivar_historico(self.leitos, dias=dias,
+                                                                  maximo=int(maximo) if maximo is not None else None)}
+        if partes == ["lote"] and metodo == "POST":
+            operacoes = _campo(corpo, "operacoes")
+            if not isinstance(operacoes, list) or not all(isinstance(op, dict) for op in operacoes):
+                raise ErroHTTP(400, "Campo 'operacoes' deve ser uma lista de objetos.")
+            resultados = sprint.aplicar_lote(self.leitos, operacoes, bool(corpo.get("tudo_ou_nada")))
+            return 200, resultados
+        if not partes or partes[0] != "leitos" or len(partes) > 3:
+            raise ErroHTTP(404, "Rota não encontrada.")
+
+        if len(partes) == 1:
+            if metodo == "GET":
+                status = parametros.get("status", [None])[0]
+                leitos = sprint.leitos_por_status(self.leitos, status) if status else self.leitos
+                return 200, [sprint.leito_para_json(leito) for leito in leitos]
+            if metodo == "POST":
+                numero = str(_campo(corpo, "numero")).strip()
+                if not sprint.numero_valido(numero):
+                    raise ErroHTTP(400, sprint.MENSAGEM_NUMERO_INVALIDO)
+                if not sprint.adicionar_leito(self.leitos, numero):
+                    raise ErroHTTP(409, f"Leito {numero} já existe.")
+                return 201, sprint.leito_para_json(sprint.encontrar_leito(self.leitos, numero))
+            raise ErroHTTP(405, "Método não permitido.")
+
+        numero = partes[1]
+        if len(partes) == 2:
+            if metodo == "GET":
+                return 200, sprint.leito_para_json(self._leito(numero))
+            if metodo == "DELETE":
+                leito = self._leito(numero)
+                if not sprint.remover_leito(self.leitos, numero, confirmar=False):
+                    raise ErroHTTP(409, f"Leito {numero} está {leito['status'].lower()}; não pode ser removido.")
+                return 200, {"removido": numero}
+            raise ErroHTTP(405, "Método não permitido.")
+
+        acao = partes[2]
+        if acao == "historico" and metodo == "GET":
+            return 200, [sprint._serializar_historico(h) for h in self._leito(numero)["historico"]]
+        if acao not in sprint.TRANSICOES:
+            raise ErroHTTP(404, "Rota não encontrada.")
+        if metodo != "POST":
+            raise ErroHTTP(405, "Método não permitido.")
+        paciente = None
+        if acao == "ocupar":
+            paciente = str(_campo(corpo, "paciente")).strip()
+            if not paciente:
+                raise ErroHTTP(400, "Informe o nome do paciente.")
+        try:
+            versao = sprint.versao_esperada(corpo.get("versao"))
+        except ValueError as e:
+            raise ErroHTTP(400, str(e))
+        resultado = sprint.executar_transicao(self.leitos, numero, acao, paciente, versao)
+        if not resultado["sucesso"]:
+            raise ErroHTTP(CODIGOS_ERRO[resultado["erro"]], resultado["mensagem"])
+        return 200, sprint.leito_para_json(self._leito(numero))
+
+    def _leito(self, numero):
+        leito = sprint.encontrar_leito(self.leitos, numero)
+        if not leito:
+            raise ErroHTTP(404, f"Leito {numero} não encontrado.")
+        return leito
+
+    def _buscar(self, parametros):
+        if "status" in parametros:
+            return sprint.leitos_por_status(self.leitos, parametros["status"][0])
+        if "paciente" in parametros:
+            estadias = sprint.buscar_pacientes(self.leitos, parametros["paciente"][0])
+            return [self.leitos.obter(e["numero"]) for e in estadias if e["fim"] is None]
+        if "numero" in parametros:
+            leito = sprint.encontrar_leito(self.leitos, parametros["numero"][0])
+            return [leito] if leito else []
+        raise ErroHTTP(400, "Informe status, paciente ou numero.")
+
+
+def _campo(corpo, nome):
+    if nome not in corpo:
+        raise ErroHTTP(400, f"Campo '{nome}' obrigatório.")
+    return corpo[nome]
+
+
+# Camada HTTP (HTTP/1.1 com keep-alive)
+
+async def _ler_requisicao(leitor):
+    """Lê uma requisição; retorna None quando o cliente fecha a conexão."""
+    linha = await leitor.readline()
+    if not linha:
+        return None
+    try:
+        metodo, alvo, versao = linha.decode("latin-1").split()
+    except ValueError:
+        raise ErroHTTP(400, "Linha de requisição inválida.")
+    cabecalhos = {}
+    while True:
+        linha = await leitor.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    tamanho = int(cabecalhos.get("content-length", 0) or 0)
+    corpo = await leitor.readexactly(tamanho) if tamanho else b""
+    return metodo.upper(), alvo, versao, cabecalhos, corpo
+
+
+def _resposta(codigo, dados, manter_conexao):
+    if isinstance(dados, Texto):
+        corpo, tipo = dados.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        corpo, tipo = json.dumps(dados, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    cabecalho = (f"HTTP/1.1 {codigo} {MOTIVOS.get(codigo, '')}\r\n"
+                 f"Content-Type: {tipo}\r\n"
+                 f"Content-Length: {len(corpo)}\r\n"
+                 f"Connection: {'keep-alive' if manter_conexao else 'close'}\r\n\r\n")
+    return cabecalho.encode("latin-1") + corpo
+
+
+async def transmitir_eventos(servico, escritor, consulta, cabecalhos):
+    """Envia (Server-Sent Events) cada evento dos leitos que passa pelos filtros, até o
+    cliente desconectar. Um cliente lento perde os eventos mais antigos da sua fila e
+    recebe um evento "perdidos" com a quantidade descartada."""
+    parametros = parse_qs(consulta)
+    try:
+        desde = int(cabecalhos["last-event-id"]) if "last-event-id" in cabecalhos else None
+    except ValueError:
+        desde = None
+    loop = asyncio.get_running_loop()
+    chegou = asyncio.Event()
+
+    def avisar():  # Chamada na thread de trabalho, a cada evento publicado
+        with contextlib.suppress(RuntimeError):  # Laço já encerrado
+            loop.call_soon_threadsafe(chegou.set)
+
+    assinatura = servico.eventos.assinar(parametros.get("status"), parametros.get("ala"), LIMITE_FILA_EVENTOS,
+                                         desde, avisar)
+    escritor.write(b"HTTP/1.1 200 OK\r\n"
+                   b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                   b"Cache-Control: no-cache\r\n"
+                   b"Connection: close\r\n\r\n")
+    chegou.set()  # Envia já os eventos guardados (Last-Event-ID) ou um pulso que confirma a conexão
+    perdidos = 0
+    try:
+        while True:
+            await escritor.drain()  # Cliente lento: a fila dele enche enquanto esperamos aqui
+            try:
+                await asyncio.wait_for(chegou.wait(), INTERVALO_PULSO)
+            except asyncio.TimeoutError:
+                escritor.write(b": pulso\n\n")  # Também revela clientes que já saíram
+                continue
+            chegou.clear()
+            pendentes = assinatura.retirar()
+            if assinatura.perdidos != perdidos:
+                escritor.write(f"event: perdidos\ndata: {assinatura.perdidos - perdidos}\n\n".encode("utf-8"))
+                perdidos = assinatura.perdidos
+            if not pendentes:
+                escritor.write(b": pulso\n\n")
+            escritor.write(b"".join(f"id: {dados['id']}\nevent: {dados['evento']}\ndata: {texto}\n\n".encode("utf-8")
+                                    for dados, texto in pendentes))
+    finally:
+        servico.eventos.cancelar(assinatura)
+
+
+async def atender(servico, leitor, escritor):
+    """Atende as requisições de uma conexão até o cliente encerrá-la."""
+    try:
+        while True:
+            try:
+                requisicao = await _ler_requisicao(leitor)
+            except ErroHTTP as e:
+                escritor.write(_resposta(e.codigo, {"erro": e.mensagem}, False))
+                break
+            if requisicao is None:
+                break
+            metodo, alvo, versao, cabecalhos, corpo = requisicao
+            manter = cabecalhos.get("connection", "").lower() != "close" and versao != "HTTP/1.0"
+            url = urlsplit(alvo)
+            if metodo == "GET" and url.path.rstrip("/") == "/eventos":
+                await transmitir_eventos(servico, escritor, url.query, cabecalhos)
+                break
+            try:
+                dados = json.loads(corpo) if corpo else {}
+                if not isinstance(dados, dict):
+                    raise ValueError
+            except ValueError:
+                escritor.write(_resposta(400, {"erro": "Corpo JSON inválido."}, manter))
+            else:
+                codigo, resposta = await servico.executar(metodo, url.path, url.query, dados)
+                escritor.write(_resposta(codigo, resposta, manter))
+            await escritor.drain()
+            if not manter:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except asyncio.CancelledError:
+        pass  # Serviço encerrando com conexões (como as de /eventos) ainda abertas
+    finally:
+        escritor.close()
+
+
+async def servir(arquivo="leitos.json", host="127.0.0.1", porta=8080, silencioso=False, pronto=None,
+                 historico_separado=None):
+    """Inicia o serviço e atende até ser cancelado; grava os leitos ao encerrar."""
+    servico = ServicoLeitos(arquivo, silencioso, historico_separado)
+    # SIGTERM encerra como Ctrl+C, gravando os leitos (sem suporte no Windows)
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    servidor = await asyncio.start_server(lambda l, e: atender(servico, l, e), host, porta)
+    print(f"Servindo leitos de {arquivo} em http://{host}:{porta}", flush=True)
+    if pronto:
+        pronto()
+    sincronizacao = asyncio.create_task(servico.sincronizar_periodicamente())
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        sincronizacao.cancel()
+        servico.encerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON de leitos.")
+    parser.add_argument("--arquivo", default="leitos.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--silencioso", action="store_true", help="não exibe as mensagens de cada operação")
+    parser.add_argument("--historico", choices=sprint.FORMATOS_HISTORICO,
+                        help="formato dos snapshots JSON: histórico em arquivos por leito ou no arquivo principal "
+                             "(padrão: SPRINT_HISTORICO_SEPARADO ou o formato carregado)")
+    parser.add_argument("--metricas", action="store_true", help="mede as operações e expõe GET /metrics")
+    parser.add_argument("--metricas-json", metavar="ARQUIVO", help="grava também as métricas em JSON periodicamente")
+    parser.add_argument("--metricas-intervalo", type=float, default=60, help="segundos entre as gravações do JSON")
+    args = parser.parse_args()
+    if args.metricas or args.metricas_json:
+        metricas = sprint.ativar_metricas()
+        if args.metricas_json:
+            metricas.gravar_periodicamente(args.metricas_json, args.metricas_intervalo)
+    try:
+        asyncio.run(servir(args.arquivo, args.host, args.porta, args.silencioso,
+                           historico_separado=sprint.FORMATOS_HISTORICO.get(args.historico)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Servidor encerrado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,23 @@
+import atexit
+import bisect
+import contextlib
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
 import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Credenciais de exemplo (em caso de um sistema real, isso viria de um banco de dados seguro)
@@ -6,68 +25,2251 @@ ENFERMEIRO_CREDENCIAIS = {"enfermeiro1": "senha123", "enfermeiro2": "abcd"}
 PACIENTE_CREDENCIAIS = {"paciente1": "1234", "paciente2": "efgh"}
 
 
+# Métricas (desligadas por padrão; ver ativar_metricas)
+
+class Metricas:
+    """Latência das operações (histogramas), transições por status, cargas e
+    gravações (duração e tamanho do arquivo) e erros, exportáveis no formato
+    texto do Prometheus ou em JSON."""
+
+    # Limites superiores (em segundos) das faixas dos histogramas de latência
+    LIMITES = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.latencias = {}   # operacao -> {"faixas": [...], "soma": s, "total": n}
+        self.transicoes = {}  # (status anterior, novo status) -> quantidade
+        self.arquivos = {}    # "salvar"/"carregar" -> {"total": n, "bytes": último tamanho, "bytes_total": soma}
+        self.erros = {}       # (operacao, tipo do erro) -> quantidade
+
+    def observar(self, operacao, segundos):
+        with self._trava:
+            latencia = self.latencias.get(operacao)
+            if latencia is None:
+                latencia = self.latencias[operacao] = {"faixas": [0] * (len(self.LIMITES) + 1), "soma": 0.0, "total": 0}
+            latencia["faixas"][bisect.bisect_left(self.LIMITES, segundos)] += 1
+            latencia["soma"] += segundos
+            latencia["total"] += 1
+
+    def contar_transicao(self, anterior, novo):
+        with self._trava:
+            self.transicoes[(anterior, novo)] = self.transicoes.get((anterior, novo), 0) + 1
+
+    def registrar_arquivo(self, operacao, tamanho):
+        with self._trava:
+            arquivo = self.arquivos.setdefault(operacao, {"total": 0, "bytes": 0, "bytes_total": 0})
+            arquivo["total"] += 1
+            arquivo["bytes"] = tamanho
+            arquivo["bytes_total"] += tamanho
+
+    def registrar_erro(self, operacao, erro):
+        chave = (operacao, type(erro).__name__)
+        with self._trava:
+            self.erros[chave] = self.erros.get(chave, 0) + 1
+
+    def como_dicionario(self):
+        """Retrato das métricas pronto para JSON."""
+        with self._trava:
+            return {
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "limites_segundos": list(self.LIMITES),
+                "latencias": {operacao: {"faixas": list(l["faixas"]), "soma": l["soma"], "total": l["total"]}
+                              for operacao, l in self.latencias.items()},
+                "transicoes": [{"de": de, "para": para, "total": total} for (de, para), total in self.transicoes.items()],
+                "arquivos": {operacao: dict(a) for operacao, a in self.arquivos.items()},
+                "erros": [{"operacao": operacao, "erro": erro, "total": total}
+                          for (operacao, erro), total in self.erros.items()],
+            }
+
+    def prometheus(self):
+        """Métricas no formato texto de exposição do Prometheus."""
+        dados = self.como_dicionario()
+        linhas = ["# HELP sprint_operacao_segundos Latência das operações sobre os leitos.",
+                  "# TYPE sprint_operacao_segundos histogram"]
+        for operacao, latencia in sorted(dados["latencias"].items()):
+            rotulo = f'operacao="{_rotulo(operacao)}"'
+            acumulado = 0
+            for limite, quantidade in zip(self.LIMITES + ("+Inf",), latencia["faixas"]):
+                acumulado += quantidade
+                linhas.append(f'sprint_operacao_segundos_bucket{{{rotulo},le="{limite}"}} {acumulado}')
+            linhas.append(f"sprint_operacao_segundos_sum{{{rotulo}}} {latencia['soma']}")
+            linhas.append(f"sprint_operacao_segundos_count{{{rotulo}}} {latencia['total']}")
+        linhas += ["# HELP sprint_transicoes_total Mudanças de status dos leitos.",
+                   "# TYPE sprint_transicoes_total counter"]
+        linhas += [f'sprint_transicoes_total{{de="{_rotulo(t["de"])}",para="{_rotulo(t["para"])}"}} {t["total"]}'
+                   for t in dados["transicoes"]]
+        linhas += ["# HELP sprint_arquivo_operacoes_total Cargas e gravações dos dados dos leitos.",
+                   "# TYPE sprint_arquivo_operacoes_total counter"]
+        linhas += [f'sprint_arquivo_operacoes_total{{operacao="{o}"}} {a["total"]}' for o, a in dados["arquivos"].items()]
+        linhas += ["# HELP sprint_arquivo_bytes Tamanho do arquivo na última carga ou gravação.",
+                   "# TYPE sprint_arquivo_bytes gauge"]
+        linhas += [f'sprint_arquivo_bytes{{operacao="{o}"}} {a["bytes"]}' for o, a in dados["arquivos"].items()]
+        linhas += ["# HELP sprint_erros_total Erros tratados (exibidos ao usuário) por operação.",
+                   "# TYPE sprint_erros_total counter"]
+        linhas += [f'sprint_erros_total{{operacao="{_rotulo(e["operacao"])}",erro="{_rotulo(e["erro"])}"}} {e["total"]}'
+                   for e in dados["erros"]]
+        return "\n".join(linhas) + "\n"
+
+    def gravar_json(self, caminho):
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.como_dicionario(), f, indent=4, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    def gravar_periodicamente(self, caminho, intervalo=60.0):
+        """Grava as métricas em JSON a cada `intervalo` segundos (e ao encerrar o programa).
+        Retorna um threading.Event que, ao ser acionado, interrompe as gravações."""
+        parar = threading.Event()
+
+        def gravar():
+            while not parar.wait(intervalo):
+                self.gravar_json(caminho)
+
+        threading.Thread(target=gravar, name="metricas", daemon=True).start()
+        atexit.register(self.gravar_json, caminho)
+        return parar
+
+
+def _rotulo(texto):
+    """Escapa um valor de rótulo do Prometheus."""
+    return str(texto).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICAS = None  # Instância de Metricas quando a instrumentação está ligada
+
+
+def ativar_metricas():
+    """Liga a instrumentação (se ainda não estiver ligada) e devolve as métricas."""
+    global METRICAS
+    if METRICAS is None:
+        METRICAS = Metricas()
+    return METRICAS
+
+
+def desativar_metricas():
+    global METRICAS
+    METRICAS = None
+
+
+def _medido(operacao):
+    """Decorador que registra a latência da função em METRICAS; desligado, custa
+    só uma chamada a mais e a leitura de uma variável global."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            metricas = METRICAS
+            if metricas is None:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                metricas.observar(operacao, time.perf_counter() - inicio)
+        return medida
+    return decorador
+
+
+def _registrar_erro(operacao, erro):
+    if METRICAS is not None:
+        METRICAS.registrar_erro(operacao, erro)
+
+
+def _registrar_arquivo(operacao, arquivo):
+    if METRICAS is not None:
+        with contextlib.suppress(OSError):
+            METRICAS.registrar_arquivo(operacao, os.path.getsize(arquivo))
+
+
+@contextlib.contextmanager
+def perfil_sessao(caminho=None):
+    """Perfila (cProfile) o bloco e grava as estatísticas em `caminho`; sem caminho, não faz nada.
+    As estatísticas podem ser lidas com `python -m pstats caminho`."""
+    if not caminho:
+        yield
+        return
+    import cProfile  # Só carregado quando o perfil é pedido
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        perfil.dump_stats(caminho)
+
+
+# Estrutura de dados dos leitos
+
+# Números de leito podem ser simples ("12") ou hierárquicos: unidade/ala/leito ("HOSP1/UTI/12")
+SEPARADOR_NUMERO = "/"
+
+
+def _chave_ordenacao(numero):
+    """Chave usada para manter os leitos em ordem numérica (parte a parte nos números hierárquicos).
+
+    A chave é um texto: cada parte numérica vira "\x01" + seu tamanho + dígitos,
+    sem zeros à esquerda (assim 9 < 10 e "01" equivale a "1", como em int()), as
+    demais "\x02" + o texto em minúsculas, separadas por "\x00". Comparar textos
+    é bem mais rápido que comparar tuplas no bisect.
+    """
+    numero = str(numero)
+    if numero.isdigit():  # Caso mais comum, sem separar as partes
+        return _chave_digitos(numero)
+    return "\x00".join(_chave_digitos(parte) if parte.isdigit() else "\x02" + parte.casefold()
+                       for parte in numero.split(SEPARADOR_NUMERO))
+
+
+def _chave_digitos(parte):
+    digitos = parte.lstrip("0") or "0"
+    return "\x01" + chr(len(digitos)) + digitos
+
+
+def numero_valido(numero):
+    """Confere um número de leito: dígitos, opcionalmente precedidos de unidade e ala
+    (letras, dígitos ou "-"), como "12", "UTI/12" ou "HOSP1/UTI/12"."""
+    partes = str(numero).split(SEPARADOR_NUMERO)
+    if len(partes) > 3 or not partes[-1].isdigit():
+        return False
+    return all(parte and all(c.isalnum() or c == "-" for c in parte) for parte in partes[:-1])
+
+
+MENSAGEM_NUMERO_INVALIDO = "Número de leito inválido. Use apenas dígitos, opcionalmente após unidade e ala (ex.: HOSP1/UTI/12)."
+
+
+def fragmento_do_leito(numero):
+    """Unidade/ala a que o leito pertence ("" para números simples)."""
+    return str(numero).rpartition(SEPARADOR_NUMERO)[0]
+
+
+class _ListaOrdenada:
+    """Lista de leitos mantida em ordem numérica com bisect (chaves e leitos em paralelo)."""
+
+    __slots__ = ("chaves", "leitos")
+
+    def __init__(self, leitos=()):
+        self.leitos = sorted(leitos, key=lambda x: _chave_ordenacao(x["numero"]))
+        self.chaves = [_chave_ordenacao(leito["numero"]) for leito in self.leitos]
+
+    def __len__(self):
+        return len(self.leitos)
+
+    def inserir(self, leito):
+        chave = _chave_ordenacao(leito["numero"])
+        posicao = bisect.bisect_right(self.chaves, chave)
+        self.chaves.insert(posicao, chave)
+        self.leitos.insert(posicao, leito)
+
+    def remover(self, leito):
+        posicao = bisect.bisect_left(self.chaves, _chave_ordenacao(leito["numero"]))
+        # Números como "1" e "01" compartilham a mesma chave; procura o objeto exato
+        while self.leitos[posicao] is not leito:
+            posicao += 1
+        del self.chaves[posicao]
+        del self.leitos[posicao]
+
+
+class RegistroLeitos:
+    """Coleção de leitos indexada pelo número e pelo status.
+
+    Mantém um dicionário numero -> leito para buscas em O(1) e uma visão
+    ordenada (lista de chaves + lista de leitos, mantidas com bisect), de modo
+    que inserir ou remover um leito nunca reordena a coleção inteira.
+    Também mantém, para cada status, a lista ordenada dos leitos nesse status,
+    atualizada a cada transição: contagens saem em O(1) e listagens por status
+    (como a de ocupados) em O(k), sem filtrar nem ordenar a coleção.
+    Pode ser percorrida como a lista de leitos original.
+    """
+
+    def __init__(self, leitos=None):
+        self._indexar(leitos or [])
+        self._ouvintes = []
+        self._adiados = []  # Eventos já notificados que aguardam a gravação (veja notificar)
+        self.diario = None
+        self.banco = None
+        self.historico_separado = False
+        self.compacto = False
+        self.arquivo = None  # Arquivo de onde os leitos foram carregados
+        self.posicao_diario = None
+
+    def _indexar(self, leitos):
+        """(Re)constrói todos os índices a partir de uma sequência de leitos."""
+        self._indice = {}
+        for leito in leitos:
+            self._indice.setdefault(str(leito["numero"]), leito)
+        # Ordenação única na carga; depois disso só inserções pontuais
+        self._ordenados = _ListaOrdenada(self._indice.values())
+        self._por_status = {}
+        for leito in self._ordenados.leitos:
+            self._lista_status(leito["status"]).leitos.append(leito)
+        for lista in self._por_status.values():
+            lista.chaves = [_chave_ordenacao(leito["numero"]) for leito in lista.leitos]
+        self._pacientes = None  # Índice de pacientes, montado na primeira busca
+        self._linhas = {}  # Partes fixas das linhas de exibição, por número (ver _partes_fixas)
+        self._historico_exibido = None  # Linhas do histórico já formatadas (ver _CacheHistorico)
+
+    def _lista_status(self, status):
+        lista = self._por_status.get(status)
+        if lista is None:
+            lista = self._por_status[status] = _ListaOrdenada()
+        return lista
+
+    def __len__(self):
+        return len(self._ordenados)
+
+    def __iter__(self):
+        return iter(self._ordenados.leitos)
+
+    def __getitem__(self, posicao):
+        return self._ordenados.leitos[posicao]
+
+    def __contains__(self, numero):
+        return str(numero) in self._indice
+
+    def __repr__(self):
+        return f"RegistroLeitos({self._ordenados.leitos!r})"
+
+    def obter(self, numero):
+        """Retorna o leito com o número informado, ou None."""
+        return self._indice.get(str(numero))
+
+    def adicionar(self, leito):
+        """Insere um leito na posição ordenada. Retorna False se o número já existir."""
+        numero = str(leito["numero"])
+        if numero in self._indice:
+            return False
+        self._ordenados.inserir(leito)
+        self._lista_status(leito["status"]).inserir(leito)
+        self._indice[numero] = leito
+        self.registrou_historico(leito)
+        return True
+
+    def remover(self, numero):
+        """Remove e retorna o leito com o número informado, ou None se não existir."""
+        leito = self._indice.pop(str(numero), None)
+        if leito is None:
+            return None
+        self._ordenados.remover(leito)
+        self._por_status[leito["status"]].remover(leito)
+        if self._pacientes is not None:
+            self._pacientes.removeu(leito["numero"])
+        self._linhas.pop(leito["numero"], None)
+        if self._historico_exibido is not None:
+            self._historico_exibido.descartar(leito["numero"])
+        return leito
+
+    def mudou_status(self, leito, status_anterior):
+        """Move o leito para a lista do novo status após uma transição."""
+        if status_anterior != leito["status"]:
+            self._por_status[status_anterior].remover(leito)
+            self._lista_status(leito["status"]).inserir(leito)
+
+    def registrou_historico(self, leito):
+        """Leva ao índice de pacientes (se já montado) as novas entradas do histórico do leito
+        e descarta as linhas de exibição guardadas do leito, que mudou de estado."""
+        if self._pacientes is not None:
+            self._pacientes.indexar_leito(leito)
+        self._linhas.pop(leito["numero"], None)
+
+    def encurtou_historico(self, leito):
+        """Entradas antigas saíram do histórico do leito (arquivo morto): as posições
+        guardadas no índice de pacientes e no cache de exibição deixam de valer."""
+        self._pacientes = None
+        if self._historico_exibido is not None:
+            self._historico_exibido.descartar(leito["numero"])
+
+    def cache_historico(self):
+        """Linhas de exibição do histórico, formatadas na primeira exibição de cada leito."""
+        if self._historico_exibido is None:
+            self._historico_exibido = _CacheHistorico()
+        return self._historico_exibido
+
+    def indice_pacientes(self):
+        """Índice de pacientes atuais e anteriores, montado na primeira chamada e
+        depois mantido a cada transição. No SQLite, as ocupações são lidas do
+        banco de uma só vez, sem carregar o histórico de cada leito."""
+        if self._pacientes is None:
+            if self.banco:
+                self._pacientes = IndicePacientes.de_entradas(self, self.banco.entradas_de_ocupacao())
+            else:
+                self._pacientes = IndicePacientes(self._ordenados.leitos)
+        return self._pacientes
+
+    def transacao(self, numero=None):
+        """Contexto para alterar os leitos com segurança entre processos: usa a
+        trava do diário ou uma transação do banco, conforme o armazenamento."""
+        if self.diario:
+            return self.diario.transacao()
+        if self.banco:
+            return self.banco.transacao(self, numero)
+        return contextlib.nullcontext()
+
+    # Consultas de painel
+
+    def quantidade(self, status):
+        """Quantos leitos estão no status informado (O(1))."""
+        lista = self._por_status.get(status)
+        return len(lista) if lista else 0
+
+    def contagem_por_status(self):
+        """Dicionário status -> quantidade de leitos, só com status presentes."""
+        return {status: len(lista) for status, lista in self._por_status.items() if lista}
+
+    def com_status(self, status):
+        """Leitos no status informado, já em ordem numérica (cópia da visão interna)."""
+        lista = self._por_status.get(status)
+        return list(lista.leitos) if lista else []
+
+    def inscrever(self, ouvinte):
+        """Registra uma função chamada como ouvinte(evento, leito, entrada) a cada evento."""
+        self._ouvintes.append(ouvinte)
+
+    def cancelar_inscricao(self, ouvinte):
+        if ouvinte in self._ouvintes:
+            self._ouvintes.remove(ouvinte)
+
+    def notificar(self, evento, leito, entrada=None):
+        """Repassa um evento ("adicionar", "remover" ou "transicao") aos ouvintes.
+        Transições também atualizam as listas por status.
+
+        Com diário ou banco, o armazenamento recebe o evento primeiro; os demais
+        ouvintes (como o feed de eventos) só o recebem depois que ele for gravado,
+        no fim da transação em andamento, e nunca se a transação for desfeita."""
+        if evento == "transicao":
+            self.mudou_status(leito, entrada["status_anterior"])
+            self.registrou_historico(leito)
+        if not self.diario and not self.banco:
+            self.repassar(evento, leito, entrada)
+            return
+        with self.transacao():
+            for ouvinte in self._ouvintes:
+                if ouvinte is self.diario or ouvinte is self.banco:
+                    ouvinte(evento, leito, entrada)
+            if any(ouvinte is not self.diario and ouvinte is not self.banco for ouvinte in self._ouvintes):
+                # Cópia: até a gravação, o leito ainda pode mudar (por exemplo, em um lote)
+                self._adiados.append((evento, leito.copy(), entrada))
+
+    def confirmar_eventos(self):
+        """Chamado pelo armazenamento após gravar: entrega os eventos adiados aos demais ouvintes."""
+        adiados, self._adiados = self._adiados, []
+        for evento, leito, entrada in adiados:
+            self.repassar(evento, leito, entrada)
+
+    def descartar_eventos(self):
+        """Chamado pelo armazenamento ao desfazer uma transação: os eventos adiados não aconteceram."""
+        self._adiados = []
+
+    def repassar(self, evento, leito, entrada=None):
+        """Repassa um evento feito por outro processo (lido do diário ou do banco) aos
+        ouvintes, como o feed de eventos; o armazenamento, que já o tem gravado, fica de fora."""
+        for ouvinte in self._ouvintes:
+            if ouvinte is not self.diario and ouvinte is not self.banco:
+                ouvinte(evento, leito, entrada)
+
+    def sincronizar(self):
+        """Traz as alterações gravadas por outros processos, sem alterar nada (para leituras)."""
+        if self.diario:
+            with self.diario.transacao():
+                pass  # A transação aplica os eventos dos demais ao obter a trava
+        elif self.banco:
+            self.banco.sincronizar(self)
+
+
+def _houve_transicao(leito, status_anterior, versao_anterior):
+    """Se um leito alterado por outro processo passou por transições (e não só pelo
+    arquivamento do histórico, que também incrementa a versão)."""
+    return leito["status"] != status_anterior or _versao(leito) - versao_anterior > 1
+
+
+# Representação compacta dos leitos
+
+STATUS_LEITO = ["Disponível", "Ocupado", "Em Limpeza", "Em Manutenção", "Leito Pronto"]
+_CODIGOS_STATUS = {status: codigo for codigo, status in enumerate(STATUS_LEITO)}
+
+_EPOCA = datetime(1970, 1, 1)
+_SEGUNDO = timedelta(seconds=1)
+
+
+def _codigo_status(status):
+    """Código numérico (0..127) de um status; status desconhecidos são registrados na hora."""
+    codigo = _CODIGOS_STATUS.get(status)
+    if codigo is None:
+        codigo = _CODIGOS_STATUS[status] = len(STATUS_LEITO)
+        STATUS_LEITO.append(status)
+    return codigo
+
+
+class _TabelaTextos:
+    """Tabela de textos internados: cada texto repetido é guardado uma única vez."""
+
+    def __init__(self):
+        self._textos = []
+        self._codigos = {}
+
+    def codigo(self, texto):
+        codigo = self._codigos.get(texto)
+        if codigo is None:
+            codigo = self._codigos[texto] = len(self._textos)
+            self._textos.append(texto)
+        return codigo
+
+    def texto(self, codigo):
+        return self._textos[codigo]
+
+
+# Pacientes, tipos de registro e durações se repetem muito entre as entradas
+_TEXTOS_HISTORICO = _TabelaTextos()
+
+
+class HistoricoColunar:
+    """Histórico de um leito guardado em colunas (arrays) em vez de uma lista de dicionários.
+
+    Timestamps ficam em segundos desde 1970 (array 'd'), status em códigos de
+    um byte (array 'b') e textos repetidos como índices na tabela internada
+    (array 'l', -1 para ausente). Campos fora do formato padrão vão para
+    `_extras`, então a conversão de volta para dicionários não perde nada.
+    Percorrer ou indexar o histórico devolve dicionários como os originais.
+    """
+
+    __slots__ = ("_tipos", "_timestamps", "_anteriores", "_novos", "_pacientes", "_permanencias", "_extras")
+
+    def __init__(self, entradas=()):
+        self._tipos = array("l")
+        self._timestamps = array("d")
+        self._anteriores = array("b")
+        self._novos = array("b")
+        self._pacientes = array("l")
+        self._permanencias = array("l")
+        self._extras = None
+        for entrada in entradas:
+            self.append(entrada)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __iter__(self):
+        for posicao in range(len(self)):
+            yield self._entrada(posicao)
+
+    def __getitem__(self, posicao):
+        if isinstance(posicao, slice):
+            return [self._entrada(p) for p in range(*posicao.indices(len(self)))]
+        if posicao < 0:
+            posicao += len(self)
+        if not 0 <= posicao < len(self):
+            raise IndexError("posição fora do histórico")
+        return self._entrada(posicao)
+
+    def __repr__(self):
+        return f"HistoricoColunar(total={len(self)})"
+
+    def _extra(self, posicao, chave, valor):
+        if self._extras is None:
+            self._extras = {}
+        self._extras.setdefault(posicao, {})[chave] = valor
+
+    def _texto(self, posicao, entrada, chave):
+        """Código internado de um campo de texto opcional (-1 se ausente)."""
+        if chave not in entrada:
+            return -1
+        valor = entrada[chave]
+        if isinstance(valor, str):
+            return _TEXTOS_HISTORICO.codigo(valor)
+        self._extra(posicao, chave, valor)
+        return -1
+
+    def _status(self, posicao, entrada, chave):
+        valor = entrada.get(chave)
+        if isinstance(valor, str):
+            return _codigo_status(valor)
+        if chave in entrada:
+            self._extra(posicao, chave, valor)
+        return -1
+
+    def append(self, entrada):
+        posicao = len(self)
+        timestamp = entrada.get("timestamp")
+        if isinstance(timestamp, datetime) and timestamp.tzinfo is None:
+            segundos = (timestamp - _EPOCA) / _SEGUNDO
+        else:
+            segundos = float("nan")
+            if "timestamp" in entrada:
+                self._extra(posicao, "timestamp", timestamp)
+        self._tipos.append(self._texto(posicao, entrada, "tipo"))
+        self._anteriores.append(self._status(posicao, entrada, "status_anterior"))
+        self._novos.append(self._status(posicao, entrada, "novo_status"))
+        self._pacientes.append(self._texto(posicao, entrada, "paciente"))
+        self._permanencias.append(self._texto(posicao, entrada, "tempo_permanencia"))
+        self._timestamps.append(segundos)
+        for chave, valor in entrada.items():
+            if chave not in ("tipo", "status_anterior", "novo_status", "timestamp", "paciente", "tempo_permanencia"):
+                self._extra(posicao, chave, valor)
+
+    def _entrada(self, posicao):
+        """Reconstrói o dicionário da entrada na posição informada."""
+        entrada = {}
+        if self._tipos[posicao] >= 0:
+            entrada["tipo"] = _TEXTOS_HISTORICO.texto(self._tipos[posicao])
+        if self._anteriores[posicao] >= 0:
+            entrada["status_anterior"] = STATUS_LEITO[self._anteriores[posicao]]
+        if self._novos[posicao] >= 0:
+            entrada["novo_status"] = STATUS_LEITO[self._novos[posicao]]
+        segundos = self._timestamps[posicao]
+        if segundos == segundos:  # NaN indica timestamp guardado em _extras
+            entrada["timestamp"] = _EPOCA + timedelta(seconds=segundos)
+        if self._pacientes[posicao] >= 0:
+            entrada["paciente"] = _TEXTOS_HISTORICO.texto(self._pacientes[posicao])
+        if self._permanencias[posicao] >= 0:
+            entrada["tempo_permanencia"] = _TEXTOS_HISTORICO.texto(self._permanencias[posicao])
+        if self._extras and posicao in self._extras:
+            entrada.update(self._extras[posicao])
+        return entrada
+
+
+class Leito:
+    """Leito com __slots__ e status guardado como código numérico.
+
+    Aceita o mesmo acesso por chave dos dicionários de leito
+    (leito["status"], leito.get("paciente"), leito.copy()), então todas as
+    funções do sistema funcionam com ele sem alterações.
+    """
+
+    __slots__ = ("numero", "_status", "paciente", "entrada_ocupacao", "historico", "versao")
+
+    _CAMPOS = ("numero", "status", "paciente", "entrada_ocupacao", "historico", "versao")
+
+    def __init__(self, numero, status="Disponível", paciente=None, entrada_ocupacao=None, historico=None, versao=0):
+        self.numero = numero
+        self.status = status
+        self.paciente = paciente
+        self.entrada_ocupacao = entrada_ocupacao
+        self.historico = HistoricoColunar() if historico is None else historico
+        self.versao = versao
+
+    @property
+    def status(self):
+        return STATUS_LEITO[self._status]
+
+    @status.setter
+    def status(self, valor):
+        self._status = _codigo_status(valor)
+
+    @classmethod
+    def de_dicionario(cls, leito):
+        """Converte um leito em dicionário; históricos lidos sob demanda são mantidos como estão."""
+        historico = leito["historico"]
+        if isinstance(historico, HistoricoAdiado) or not isinstance(historico, (HistoricoColunar, _HistoricoSobDemanda)):
+            historico = HistoricoColunar(historico)
+        return cls(leito["numero"], leito["status"], leito["paciente"], leito["entrada_ocupacao"], historico,
+                   leito.get("versao") or 0)
+
+    def __getitem__(self, chave):
+        if chave not in self._CAMPOS:
+            raise KeyError(chave)
+        return getattr(self, chave)
+
+    def __setitem__(self, chave, valor):
+        if chave not in self._CAMPOS:
+            raise KeyError(chave)
+        setattr(self, chave, valor)
+
+    def __contains__(self, chave):
+        return chave in self._CAMPOS
+
+    def get(self, chave, padrao=None):
+        return getattr(self, chave) if chave in self._CAMPOS else padrao
+
+    def copy(self):
+        """Cópia em dicionário, no formato usado para gravar os leitos."""
+        return {campo: getattr(self, campo) for campo in self._CAMPOS}
+
+    def __repr__(self):
+        return f"Leito({self.numero!r}, {self.status!r})"
+
+
+def compactar_leitos(leitos):
+    """Converte os leitos (dicionários) para a representação compacta.
+    Um RegistroLeitos é convertido no próprio lugar, mantendo índice, diário e ouvintes."""
+    if not isinstance(leitos, RegistroLeitos):
+        leitos = RegistroLeitos(leitos)
+    leitos._indexar([leito if isinstance(leito, Leito) else Leito.de_dicionario(leito) for leito in leitos])
+    leitos.compacto = True
+    return leitos
+
+
+def _leitos_ordenados(leitos):
+    """Retorna os leitos em ordem numérica, sem reordenar quando já vierem de um registro."""
+    if isinstance(leitos, RegistroLeitos):
+        return leitos
+    return sorted(leitos, key=lambda x: _chave_ordenacao(x['numero']))
+
+
+# Consultas de ocupação (O(1)/O(k) com RegistroLeitos; varredura em listas simples)
+
+STATUS_LIVRES = ("Disponível", "Leito Pronto")
+
+
+def contar_leitos_por_status(leitos):
+    """Retorna um dicionário status -> quantidade de leitos."""
+    if isinstance(leitos, RegistroLeitos):
+        return leitos.contagem_por_status()
+    contagem = {}
+    for leito in leitos:
+        contagem[leito["status"]] = contagem.get(leito["status"], 0) + 1
+    return contagem
+
+
+def leitos_por_status(leitos, status):
+    """Leitos no status informado (sem diferenciar maiúsculas), em ordem numérica."""
+    status = status.strip().lower()
+    if isinstance(leitos, RegistroLeitos):
+        resultados = []
+        for nome in leitos.contagem_por_status():
+            if nome.lower() == status:
+                resultados.extend(leitos.com_status(nome))
+        return resultados
+    return _leitos_ordenados([leito for leito in leitos if leito["status"].lower() == status])
+
+
+def leitos_ocupados(leitos):
+    """Leitos ocupados, em ordem numérica."""
+    if isinstance(leitos, RegistroLeitos):
+        return leitos.com_status("Ocupado")
+    return leitos_por_status(leitos, "Ocupado")
+
+
+def resumo_ocupacao(leitos):
+    """Resumo para painéis: total, livres (Disponível/Leito Pronto), ocupados e contagem por status."""
+    contagem = contar_leitos_por_status(leitos)
+    return {
+        "total": len(leitos),
+        "livres": sum(contagem.get(status, 0) for status in STATUS_LIVRES),
+        "ocupados": contagem.get("Ocupado", 0),
+        "por_status": contagem,
+    }
+
+
+def leito_para_json(leito):
+    """Estado atual de um leito, sem o histórico, pronto para JSON (serviço HTTP e comandos.py)."""
+    entrada = leito["entrada_ocupacao"]
+    return {
+        "numero": leito["numero"],
+        "status": leito["status"],
+        "paciente": leito["paciente"],
+        "entrada_ocupacao": entrada.isoformat() if entrada else None,
+        "versao": _versao(leito),
+        "historico_total": len(leito["historico"]),
+    }
+
+
+# Feed de eventos em tempo real
+
+class BarramentoEventos:
+    """Publica cada evento dos leitos (adição, remoção e transição) para assinantes.
+
+    É um ouvinte do RegistroLeitos (`leitos.inscrever(barramento)`): cada evento
+    vira um dicionário, serializado em JSON uma única vez e compartilhado por
+    todos os assinantes. Cada assinante tem uma fila limitada; quem não
+    consome a tempo perde os eventos mais antigos (contados em `perdidos`)
+    em vez de atrasar quem grava. Os últimos eventos ficam guardados para que
+    um assinante que reconectou retome a partir do último id recebido.
+    """
+
+    def __init__(self, guardados=1000):
+        self._trava = threading.Lock()
+        self._assinaturas = []
+        self._recentes = deque(maxlen=guardados)
+        self._ultimo_id = 0
+
+    def __call__(self, evento, leito, entrada=None):
+        dados = {
+            "evento": evento,
+            "numero": leito["numero"],
+            "ala": fragmento_do_leito(leito["numero"]),
+            "status": leito["status"],
+            "status_anterior": entrada["status_anterior"] if entrada else None,
+            "paciente": leito["paciente"],
+            "versao": _versao(leito),
+            "timestamp": (entrada["timestamp"] if entrada else datetime.now()).isoformat(),
+        }
+        with self._trava:
+            self._ultimo_id += 1
+            dados["id"] = self._ultimo_id
+            publicado = (dados, json.dumps(dados, ensure_ascii=False))
+            self._recentes.append(publicado)
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            assinatura.receber(publicado)
+
+    def assinar(self, status=None, alas=None, limite=256, desde=None, avisar=None):
+        """Nova Assinatura, opcionalmente filtrada por status (novo ou anterior) e
+        por alas ("HOSP1" inclui "HOSP1/UTI"). Com `desde`, já começa com os eventos
+        guardados posteriores a esse id. `avisar()` é chamada (na thread de quem
+        publicou) sempre que chega um evento."""
+        assinatura = Assinatura(status, alas, limite, avisar)
+        with self._trava:
+            if desde is not None:
+                for publicado in self._recentes:
+                    if publicado[0]["id"] > desde:
+                        assinatura.receber(publicado)
+            self._assinaturas.append(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            if assinatura in self._assinaturas:
+                self._assinaturas.remove(assinatura)
+
+    def __len__(self):
+        return len(self._assinaturas)
+
+
+class Assinatura:
+    """Fila limitada de eventos (dicionário, JSON) de um assinante do BarramentoEventos."""
+
+    def __init__(self, status=None, alas=None, limite=256, avisar=None):
+        self.status = set(status) if status else None
+        self.alas = tuple(alas) if alas else None
+        self.perdidos = 0
+        self._fila = deque()
+        self._limite = limite
+        self._avisar = avisar
+        self._condicao = threading.Condition()
+
+    def aceita(self, dados):
+        if self.status is not None and dados["status"] not in self.status \
+                and dados["status_anterior"] not in self.status:
+            return False
+        if self.alas is not None:
+            ala = dados["ala"]
+            return any(ala == a or ala.startswith(a + SEPARADOR_NUMERO) for a in self.alas)
+        return True
+
+    def receber(self, publicado):
+        if not self.aceita(publicado[0]):
+            return
+        with self._condicao:
+            if len(self._fila) >= self._limite:
+                self._fila.popleft()  # Assinante lento: descarta o mais antigo
+                self.perdidos += 1
+            self._fila.append(publicado)
+            self._condicao.notify()
+        if self._avisar:
+            self._avisar()
+
+    def retirar(self):
+        """Todos os eventos pendentes, em ordem, como pares (dicionário, JSON)."""
+        with self._condicao:
+            pendentes = list(self._fila)
+            self._fila.clear()
+        return pendentes
+
+    def proximo(self, espera=None):
+        """Próximo evento (dicionário), esperando até `espera` segundos; None se não chegou nenhum."""
+        with self._condicao:
+            if not self._condicao.wait_for(lambda: self._fila, espera):
+                return None
+            return self._fila.popleft()[0]
+
+
+# Índice de pacientes (atuais e anteriores)
+
+def _normalizar_nome(texto):
+    """Nome em minúsculas, sem acentos e com espaços simples ("João  Silva" -> "joao silva")."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return " ".join("".join(c for c in decomposto if not unicodedata.combining(c)).casefold().split())
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _entradas_desde(historico, inicio):
+    """Entradas do histórico a partir de `inicio`, sem converter timestamps ainda adiados."""
+    if isinstance(historico, HistoricoAdiado) and historico._entradas is None:
+        if inicio >= historico.total:
+            return historico._pendentes[inicio - historico.total:]  # Sem reler o que já foi gravado
+        return historico.serializado()[inicio:]
+    if isinstance(historico, _HistoricoSobDemanda):
+        return historico.entradas_desde(inicio)
+    return historico[inicio:]
+
+
+class IndicePacientes:
+    """Índice das internações (estadias) por nome de paciente normalizado.
+
+    Cada estadia é [numero, paciente, inicio, fim], com fim None enquanto o
+    paciente está no leito. Buscas de 3 ou mais caracteres usam trigramas
+    (qualquer trecho do nome); buscas mais curtas percorrem os nomes distintos.
+    O índice é alimentado pelo histórico dos leitos e atualizado a cada
+    transição pelo RegistroLeitos, sem percorrer os demais leitos.
+    """
+
+    def __init__(self, leitos=()):
+        self._estadias = {}    # nome normalizado -> estadias
+        self._trigramas = {}   # trigrama -> nomes normalizados
+        self._abertas = {}     # numero -> estadia em andamento
+        self._indexadas = {}   # numero -> entradas do histórico já indexadas
+        self._normalizados = {}  # paciente -> nome normalizado (os mesmos nomes se repetem muito)
+        for leito in leitos:
+            self.indexar_leito(leito)
+
+    def __len__(self):
+        return sum(len(estadias) for estadias in self._estadias.values())
+
+    def _abrir(self, numero, paciente, inicio):
+        nome = self._normalizados.get(paciente)
+        if nome is None:
+            nome = self._normalizados[paciente] = _normalizar_nome(paciente)
+        if nome not in self._estadias:
+            self._estadias[nome] = []
+            for trigrama in _trigramas(nome):
+                self._trigramas.setdefault(trigrama, set()).add(nome)
+        estadia = [numero, paciente, inicio, None]
+        self._estadias[nome].append(estadia)
+        self._abertas[numero] = estadia
+
+    @classmethod
+    def de_entradas(cls, leitos, entradas):
+        """Índice montado a partir de (numero, posição, entrada) do histórico de todos os
+        leitos, em ordem de leito e de posição, como lido do banco em uma só consulta:
+        o histórico de cada leito não precisa ser carregado. Basta que as entradas
+        incluam as que abrem ou fecham uma ocupação."""
+        indice = cls()
+        for numero, grupo in itertools.groupby(entradas, key=lambda linha: linha[0]):
+            leito = leitos.obter(numero)
+            if leito is not None:
+                total = len(leito["historico"])
+                indice._indexar_entradas(numero, (h for _, posicao, h in grupo if posicao < total))
+        for leito in leitos:
+            indice._indexadas[leito["numero"]] = len(leito["historico"])
+            indice._ocupacao_atual(leito)
+        return indice
+
+    def _indexar_entradas(self, numero, entradas):
+        for h in entradas:
+            if h.get("status_anterior") == "Ocupado":
+                estadia = self._abertas.pop(numero, None)
+                if estadia:
+                    estadia[3] = h.get("timestamp")
+            if h.get("novo_status") == "Ocupado" and h.get("paciente"):
+                self._abrir(numero, h["paciente"], h.get("timestamp"))
+
+    def _ocupacao_atual(self, leito):
+        # Ocupação sem registro no histórico (dados antigos): vale o estado atual
+        numero = leito["numero"]
+        if leito["status"] == "Ocupado" and leito["paciente"] and numero not in self._abertas:
+            self._abrir(numero, leito["paciente"], leito["entrada_ocupacao"])
+
+    def indexar_leito(self, leito):
+        """Indexa as entradas do histórico do leito que ainda não foram vistas."""
+        numero = leito["numero"]
+        inicio = self._indexadas.get(numero, 0)
+        entradas = _entradas_desde(leito["historico"], inicio)
+        self._indexar_entradas(numero, entradas)
+        self._indexadas[numero] = inicio + len(entradas)
+        self._ocupacao_atual(leito)
+
+    def removeu(self, numero):
+        """Esquece a posição do histórico de um leito removido (as estadias dele continuam no índice)."""
+        self._indexadas.pop(numero, None)
+        self._abertas.pop(numero, None)
+
+    def _nomes(self, consulta):
+        if len(consulta) < 3:
+            # Curta demais para trigramas: confere o trecho em cada nome distinto ("ão" acha "João")
+            return {nome for nome in self._estadias if consulta in nome}
+        conjuntos = sorted((self._trigramas.get(t, set()) for t in _trigramas(consulta)), key=len)
+        if not conjuntos[0]:
+            return set()
+        # Os trigramas só descartam candidatos; o trecho completo é conferido no nome
+        return {nome for nome in conjuntos[0].intersection(*conjuntos[1:]) if consulta in nome}
+
+    def buscar(self, texto):
+        """Estadias de pacientes cujo nome contém `texto` (sem diferenciar maiúsculas nem acentos)."""
+        consulta = _normalizar_nome(texto)
+        if not consulta:
+            return []
+        return [estadia for nome in self._nomes(consulta) for estadia in self._estadias[nome]]
+
+
+@_medido("buscar_pacientes")
+def buscar_pacientes(leitos, texto, inicio=None, fim=None):
+    """Internações (atuais e anteriores) de pacientes cujo nome contém `texto`.
+
+    Com `inicio`/`fim`, só as que se sobrepõem ao período. Retorna dicionários
+    com "paciente", "numero", "inicio" e "fim" (None se ainda internado), em
+    ordem de leito e de entrada.
+    """
+    indice = leitos.indice_pacientes() if isinstance(leitos, RegistroLeitos) else IndicePacientes(leitos)
+    resultados = []
+    for numero, paciente, entrada, saida in indice.buscar(texto):
+        entrada, saida = _para_datetime(entrada), _para_datetime(saida)
+        if fim is not None and entrada is not None and entrada > fim:
+            continue
+        if inicio is not None and saida is not None and saida < inicio:
+            continue
+        resultados.append({"paciente": paciente, "numero": numero, "inicio": entrada, "fim": saida})
+    resultados.sort(key=lambda r: (_chave_ordenacao(r["numero"]), r["inicio"] or datetime.min))
+    return resultados
+
+
 # Funções de persistência de dados
 
-def salvar_leitos(leitos, arquivo="leitos.json"):
+def _serializar_historico(h):
+    """Cópia de uma entrada de histórico com o timestamp em ISO format."""
+    h_copia = h.copy()
+    if isinstance(h_copia.get("timestamp"), datetime):
+        h_copia["timestamp"] = h_copia["timestamp"].isoformat()
+    return h_copia
+
+
+def _desserializar_historico(h):
+    """Converte o timestamp de uma entrada de histórico de volta para datetime."""
+    if h.get("timestamp") and isinstance(h["timestamp"], str):
+        h["timestamp"] = datetime.fromisoformat(h["timestamp"])
+    return h
+
+
+def _para_datetime(valor):
+    """Timestamp como datetime, aceitando também o texto ISO de entradas ainda não convertidas."""
+    return datetime.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def _serializar_leito(leito, arquivo=None):
+    """Cópia de um leito pronta para JSON (datetimes convertidos para string).
+    Se `arquivo` for informado, o histórico é gravado no armazenamento separado
+    e a cópia leva apenas a posição dele (historico_total/historico_bytes)."""
+    leito_copia = leito.copy()
+    if leito_copia.get("entrada_ocupacao"):
+        leito_copia["entrada_ocupacao"] = leito_copia["entrada_ocupacao"].isoformat()
+    if arquivo:
+        historico = _historico_separado(leito, arquivo)
+        del leito_copia["historico"]
+        leito_copia["historico_total"] = historico.total
+        leito_copia["historico_bytes"] = historico.tamanho
+        return leito_copia
+    if isinstance(leito_copia["historico"], HistoricoAdiado):
+        # Entradas ainda não convertidas já estão no formato do JSON
+        leito_copia["historico"] = leito_copia["historico"].serializado()
+        return leito_copia
+    # Converte timestamps do histórico
+    leito_copia["historico"] = [_serializar_historico(h) for h in leito_copia["historico"]]
+    return leito_copia
+
+
+def _desserializar_leito(leito, arquivo=None, adiar=False):
+    """Converte strings ISO format de um leito carregado de volta para datetime.
+    Leitos gravados com histórico separado recebem um HistoricoLeito, lido sob demanda.
+    Com adiar=True, o histórico vira um HistoricoAdiado, convertido só quando percorrido."""
+    if leito.get("entrada_ocupacao") and isinstance(leito["entrada_ocupacao"], str):
+        leito["entrada_ocupacao"] = datetime.fromisoformat(leito["entrada_ocupacao"])
+    if "historico_bruto" in leito:
+        # Vindo do cache binário: o histórico é um bloco de bytes do JSON
+        leito["historico"] = HistoricoAdiado((), leito.pop("historico_bruto"), leito.pop("historico_total"))
+        return leito
+    if "historico" not in leito:
+        leito["historico"] = HistoricoLeito(_caminho_historico(arquivo, leito["numero"]),
+                                            leito.pop("historico_total", 0), leito.pop("historico_bytes", 0))
+        return leito
+    if adiar:
+        leito["historico"] = HistoricoAdiado(leito["historico"])
+        return leito
+    for h in leito["historico"]:
+        _desserializar_historico(h)
+    return leito
+
+
+def _gravar_snapshot(leitos, arquivo, historico_separado=None):
+    """Grava todos os leitos em `arquivo` de forma atômica (arquivo temporário + os.replace).
+    Com historico_separado=None, mantém o formato em que os leitos foram carregados."""
+    if historico_separado is None:
+        historico_separado = getattr(leitos, "historico_separado", False)
+    if historico_separado:
+        # Arquivo principal enxuto: só o estado atual de cada leito
+        leitos_para_salvar = [_serializar_leito(leito, arquivo) for leito in leitos]
+        opcoes = {"separators": (",", ":")}
+    else:
+        # Cria uma cópia profunda para evitar modificar a lista original
+        leitos_para_salvar = [_serializar_leito(leito) for leito in leitos]
+        opcoes = {"indent": 4}
+    temporario = arquivo + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(leitos_para_salvar, f, ensure_ascii=False, **opcoes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, arquivo)
+    if isinstance(leitos, RegistroLeitos):
+        leitos.historico_separado = historico_separado
+
+
+@_medido("salvar_leitos")
+def salvar_leitos(leitos, arquivo="leitos.json", historico_separado=None):
     """
     Salva os dados dos leitos em um arquivo JSON.
     Converte objetos datetime para string ISO format para compatibilidade JSON.
+    Com historico_separado=True, o histórico vai para arquivos por leito e o
+    arquivo principal guarda só o estado atual (None mantém o formato carregado).
+    Se houver um diário de eventos ativo para o mesmo arquivo, ele é zerado,
+    pois o snapshot passa a conter todas as transições registradas.
+    Arquivos .db/.sqlite são gravados no banco SQLite em uma única transação.
     """
     try:
-        # Cria uma cópia profunda para evitar modificar a lista original
-        leitos_para_salvar = []
-        for leito in leitos:
-            leito_copia = leito.copy()
-            if leito_copia.get("entrada_ocupacao"):
-                leito_copia["entrada_ocupacao"] = leito_copia["entrada_ocupacao"].isoformat()
-
-            # Converte timestamps do histórico
-            historico_copia = []
-            for h in leito_copia["historico"]:
-                h_copia = h.copy()
-                if isinstance(h_copia.get("timestamp"), datetime):
-                    h_copia["timestamp"] = h_copia["timestamp"].isoformat()
-                historico_copia.append(h_copia)
-            leito_copia["historico"] = historico_copia
-            leitos_para_salvar.append(leito_copia)
-
-        with open(arquivo, "w", encoding="utf-8") as f:
-            json.dump(leitos_para_salvar, f, ensure_ascii=False, indent=4)
+        if _eh_banco_sqlite(arquivo):
+            _banco_para(leitos, arquivo).salvar(leitos)
+            _registrar_arquivo("salvar", arquivo)
+            print("Dados salvos com sucesso.")
+            return
+        diario = getattr(leitos, "diario", None)
+        if diario and os.path.abspath(diario.arquivo) == os.path.abspath(arquivo):
+            # Traz as alterações de outros processos antes de gravar o snapshot
+            with diario.transacao():
+                _gravar_snapshot(leitos, arquivo, historico_separado)
+                diario.truncar()
+        else:
+            _gravar_snapshot(leitos, arquivo, historico_separado)
+        _registrar_arquivo("salvar", arquivo)
         print("Dados salvos com sucesso.")
     except Exception as e:
+        _registrar_erro("salvar_leitos", e)
         print(f"Erro ao salvar dados: {e}")
 
 
-def carregar_leitos(arquivo="leitos.json"):
-    """Carrega os dados dos leitos de um arquivo JSON.
-    Converte strings ISO format de volta para objetos datetime."""
-   
+# Formatos do histórico nos snapshots JSON, como escolhidos na linha de comando
+FORMATOS_HISTORICO = {"separado": True, "embutido": False}
+
+
+def escolher_historico_separado(leitos, separado=None):
+    """Escolhe o formato dos próximos snapshots JSON dos leitos: histórico em arquivos
+    por leito (True) ou dentro do arquivo principal (False). Sem `separado`, vale a
+    variável SPRINT_HISTORICO_SEPARADO ("1" ou "0"); sem ela, fica o formato carregado.
+    Não se aplica ao SQLite."""
+    if separado is None:
+        valor = os.environ.get("SPRINT_HISTORICO_SEPARADO", "").strip().lower()
+        if not valor:
+            return
+        separado = valor not in ("0", "nao", "não", "false")
+    if isinstance(leitos, RegistroLeitos) and leitos.banco is None:
+        leitos.historico_separado = separado
+
+
+def _carregar_snapshot(arquivo):
+    """Carrega os leitos gravados no snapshot JSON (ou no cache binário, se estiver em dia).
+    Os históricos só têm os timestamps convertidos quando forem percorridos."""
     try:
-        with open(arquivo, "r", encoding="utf-8") as f:
-            leitos_carregados = json.load(f)
-            # Converte strings de volta para objetos datetime
+        leitos = _ler_cache(arquivo)
+        if leitos is None:
+            with open(arquivo, "rb") as f:
+                conteudo = f.read()
+                estado = os.fstat(f.fileno())
+            leitos_carregados = json.loads(conteudo)
             for leito in leitos_carregados:
-                if leito.get("entrada_ocupacao") and isinstance(leito["entrada_ocupacao"], str):
-                    leito["entrada_ocupacao"] = datetime.fromisoformat(leito["entrada_ocupacao"])
-                for h in leito["historico"]:
-                    if h.get("timestamp") and isinstance(h["timestamp"], str):
-                        h["timestamp"] = datetime.fromisoformat(h["timestamp"])
-            return leitos_carregados
+                _desserializar_leito(leito, arquivo, adiar=True)
+            leitos = RegistroLeitos(leitos_carregados)
+            _gravar_cache(arquivo, leitos, conteudo, estado)
+        leitos.historico_separado = any(isinstance(leito["historico"], HistoricoLeito) for leito in leitos)
+        return leitos
     except FileNotFoundError:
         print("Arquivo não encontrado. Iniciando com lista de leitos vazia.")
-        return []
-    except json.JSONDecodeError:
+        return RegistroLeitos()
+    except json.JSONDecodeError as e:
+        _registrar_erro("carregar_leitos", e)
         print("Erro ao decodificar JSON. O arquivo pode estar corrompido. Iniciando com lista vazia.")
-        return []
+        return RegistroLeitos()
     except Exception as e:
+        _registrar_erro("carregar_leitos", e)
         print(f"Erro ao carregar dados: {e}")
-        return []
+        return RegistroLeitos()
+
+
+@_medido("carregar_leitos")
+def carregar_leitos(arquivo="leitos.json", compacto=False):
+    """Carrega os dados dos leitos de um arquivo JSON.
+    Converte strings ISO format de volta para objetos datetime (no histórico,
+    só quando ele for percorrido). Se o cache binário (arquivo + ".cache")
+    estiver em dia com o JSON, os leitos são lidos dele; senão, ele é regerado.
+    Se existir um diário de eventos, as transições registradas depois do
+    último snapshot são reaplicadas sobre ele.
+    Arquivos .db/.sqlite são lidos do banco SQLite, que passa a receber cada
+    transição em sua própria transação.
+    Com compacto=True, os leitos são convertidos para a representação compacta (Leito)."""
+
+    if _eh_banco_sqlite(arquivo):
+        try:
+            banco = BancoLeitos(arquivo)
+            leitos = banco.carregar()
+        except sqlite3.Error as e:
+            _registrar_erro("carregar_leitos", e)
+            print(f"Erro ao abrir banco de dados: {e}. Iniciando com lista vazia.")
+            return RegistroLeitos()
+        leitos.banco = banco
+        leitos.arquivo = arquivo
+        leitos.inscrever(banco)
+        if compacto:
+            compactar_leitos(leitos)
+        _registrar_arquivo("carregar", arquivo)
+        return leitos
+
+    # A geração é lida antes do snapshot: se houver compactação no meio, ela é detectada depois
+    geracao = _ler_geracao(_caminho_trava(arquivo))
+    leitos = _carregar_snapshot(arquivo)
+    leitos.arquivo = arquivo
+    if compacto:
+        compactar_leitos(leitos)
+    try:
+        reaplicados, posicao = _reaplicar_diario(leitos, _caminho_diario(arquivo))
+        leitos.posicao_diario = (geracao, posicao)
+        if reaplicados:
+            print(f"{reaplicados} evento(s) recuperado(s) do diário.")
+    except Exception as e:
+        _registrar_erro("reaplicar_diario", e)
+        print(f"Erro ao reaplicar diário de eventos: {e}")
+    _registrar_arquivo("carregar", arquivo)
+    return leitos
+
+
+# Histórico separado (armazenamento frio, lido sob demanda)
+
+def _diretorio_historico(arquivo):
+    """Diretório com os históricos por leito associado a um arquivo de leitos."""
+    return os.path.splitext(arquivo)[0] + "_historico"
+
+
+def _caminho_historico(arquivo, numero):
+    # "/" dos números hierárquicos vira "_" (que não aparece nos números válidos)
+    return os.path.join(_diretorio_historico(arquivo), f"leito_{str(numero).replace(SEPARADOR_NUMERO, '_')}.jsonl")
+
+
+class _HistoricoSobDemanda:
+    """Base dos históricos guardados fora da memória e lidos só quando percorridos.
+
+    As `total` entradas já gravadas vêm de `_ler(inicio)` (implementado pelas
+    subclasses, a partir da posição `inicio`); novas entradas ficam pendentes em
+    memória até serem gravadas.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self._entradas = None
+        self._pendentes = []
+
+    def __len__(self):
+        return self.total + len(self._pendentes)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        if self._entradas is not None:
+            yield from self._entradas
+        else:
+            # Percorre o armazenamento em fluxo, sem manter as entradas em memória
+            yield from self._ler()
+        yield from self._pendentes
+
+    def __getitem__(self, posicao):
+        return self.carregar()[posicao]
+
+    def _ler(self, inicio=0):
+        raise NotImplementedError
+
+    def carregar(self):
+        """Lê e mantém em memória todas as entradas do histórico."""
+        if self._entradas is None:
+            self._entradas = list(self._ler())
+        return self._entradas + self._pendentes
+
+    def append(self, entrada):
+        self._pendentes.append(entrada)
+
+    def entradas_desde(self, inicio):
+        """Entradas a partir da posição `inicio`, lendo o armazenamento só se necessário
+        e sem manter em memória o que foi lido (como a cauda pedida pelo índice de
+        pacientes ou pelo cache de exibição)."""
+        if inicio >= self.total:
+            return self._pendentes[inicio - self.total:]
+        if self._entradas is not None:
+            return self._entradas[inicio:] + self._pendentes
+        return list(self._ler(inicio)) + self._pendentes
+
+
+class HistoricoLeito(_HistoricoSobDemanda):
+    """Histórico de um leito guardado em um arquivo JSON Lines próprio.
+
+    Só `total` e `tamanho` (o trecho já confirmado do arquivo) ficam no arquivo
+    principal; as entradas são lidas apenas quando alguém percorre o histórico.
+    Novas entradas ficam pendentes em memória até o próximo salvamento, que as
+    grava a partir de `tamanho` (descartando sobras de uma gravação interrompida).
+    """
+
+    def __init__(self, caminho, total=0, tamanho=0):
+        super().__init__(total)
+        self.caminho = caminho
+        self.tamanho = tamanho
+
+    def __repr__(self):
+        return f"HistoricoLeito({self.caminho!r}, total={len(self)})"
+
+    def _ler(self, inicio=0):
+        if not self.tamanho:
+            return
+        with open(self.caminho, "rb") as f:
+            restante = self.tamanho
+            for posicao, linha in enumerate(f):
+                if restante <= 0:
+                    break
+                restante -= len(linha)
+                if posicao >= inicio:  # As linhas anteriores são só contadas, sem decodificar
+                    yield _desserializar_historico(json.loads(linha))
+
+    def gravar(self):
+        """Grava as entradas pendentes no arquivo do leito."""
+        if not self._pendentes:
+            return
+        linhas = "".join(json.dumps(_serializar_historico(h), ensure_ascii=False, separators=(",", ":")) + "\n"
+                         for h in self._pendentes).encode("utf-8")
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        modo = "r+b" if os.path.exists(self.caminho) else "wb"
+        with open(self.caminho, modo) as f:
+            f.seek(self.tamanho)
+            f.truncate()
+            f.write(linhas)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._entradas is not None:
+            self._entradas.extend(self._pendentes)
+        self.total += len(self._pendentes)
+        self.tamanho += len(linhas)
+        self._pendentes = []
+
+
+def _historico_separado(leito, arquivo):
+    """Garante que o histórico do leito esteja no armazenamento separado de `arquivo`."""
+    historico = leito["historico"]
+    caminho = _caminho_historico(arquivo, leito["numero"])
+    if not isinstance(historico, HistoricoLeito) or historico.caminho != caminho:
+        # Migração (ou cópia para outro arquivo): regrava o histórico completo
+        novo = HistoricoLeito(caminho)
+        novo._entradas = []
+        novo._pendentes = list(historico)
+        historico = leito["historico"] = novo
+    historico.gravar()
+    return historico
+
+
+# Cache binário do snapshot (inicialização rápida)
+
+# Muda sempre que o formato do cache mudar
+VERSAO_CACHE = 2
+
+
+class HistoricoAdiado(_HistoricoSobDemanda):
+    """Histórico carregado do snapshot, mas ainda não convertido.
+
+    As entradas ficam como vieram do JSON (timestamps em texto) ou, quando
+    vêm do cache, como os bytes desse JSON; a conversão para datetime só
+    acontece quando o histórico é percorrido pela primeira vez.
+    """
+
+    def __init__(self, serializadas=(), bruto=None, total=None):
+        super().__init__(len(serializadas) if total is None else total)
+        self._serializadas = serializadas if bruto is None else None
+        self._bruto = bruto
+
+    def __repr__(self):
+        return f"HistoricoAdiado(total={len(self)}, convertido={self._entradas is not None})"
+
+    def __iter__(self):
+        return iter(self.carregar())
+
+    def _gravadas(self):
+        """Entradas gravadas no formato do JSON; os bytes do cache são decodificados uma só vez."""
+        if self._serializadas is None:
+            self._serializadas = json.loads(self._bruto)
+        return self._serializadas
+
+    def _ler(self, inicio=0):
+        # A conversão é do histórico inteiro, que já está em memória: `inicio` vale para a saída
+        serializadas = self._gravadas()
+        self._serializadas = self._bruto = None
+        return [_desserializar_historico(h) for h in serializadas][inicio:]
+
+    def entradas_desde(self, inicio):
+        if inicio >= self.total:
+            return self._pendentes[inicio - self.total:]
+        return self.carregar()[inicio:]
+
+    def serializado(self):
+        """Entradas no formato do JSON, sem converter o que ainda não foi convertido."""
+        if self._entradas is not None:
+            return [_serializar_historico(h) for h in self._entradas + self._pendentes]
+        return list(self._gravadas()) + [_serializar_historico(h) for h in self._pendentes]
+
+    def bruto(self):
+        """As entradas como bytes de JSON compacto."""
+        if self._bruto is not None and not self._pendentes:
+            return self._bruto
+        return json.dumps(self.serializado(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _caminho_cache(arquivo):
+    return arquivo + ".cache"
+
+
+def _leito_para_cache(leito):
+    """Cópia do leito só com dados simples (textos, números e bytes) para o cache.
+
+    Nenhuma classe deste módulo vai para o pickle: ele guarda as classes pelo nome
+    do módulo, e um cache gravado por `import sprint` (servidor, comandos, análise)
+    traria uma segunda cópia do módulo ao ser lido por `python sprint.py`. O
+    histórico vai como um único bloco de bytes, para a leitura do cache não criar
+    um objeto por entrada.
+    """
+    copia = leito.copy()
+    if copia.get("entrada_ocupacao"):
+        copia["entrada_ocupacao"] = copia["entrada_ocupacao"].isoformat()
+    historico = copia.pop("historico")
+    if isinstance(historico, HistoricoLeito):
+        copia["historico_total"] = historico.total
+        copia["historico_bytes"] = historico.tamanho
+    else:
+        copia["historico_bruto"] = historico.bruto()
+        copia["historico_total"] = len(historico)
+    return copia
+
+
+def _ler_cache(arquivo):
+    """Leitos do cache binário de `arquivo`, ou None se ele não existir ou estiver desatualizado.
+
+    O cache vale enquanto o tamanho e a data de modificação do JSON forem os
+    mesmos de quando foi gerado; se só a data mudou (arquivo copiado ou
+    restaurado), o conteúdo é conferido pelo hash. Os leitos são montados com as
+    classes deste módulo, como na leitura do JSON.
+    """
+    try:
+        with open(_caminho_cache(arquivo), "rb") as f:
+            cabecalho = pickle.load(f)
+            estado = os.stat(arquivo)
+            if cabecalho.get("versao") != VERSAO_CACHE or cabecalho["tamanho"] != estado.st_size:
+                return None
+            if cabecalho["mtime_ns"] != estado.st_mtime_ns:
+                with open(arquivo, "rb") as original:
+                    if hashlib.blake2b(original.read(), digest_size=16).hexdigest() != cabecalho["hash"]:
+                        return None
+            return RegistroLeitos([_desserializar_leito(leito, arquivo) for leito in pickle.load(f)])
+    except Exception:
+        # Cache ausente, corrompido ou de outra versão: os leitos são lidos do JSON
+        return None
+
+
+def _gravar_cache(arquivo, leitos, conteudo, estado):
+    """Grava o cache binário dos leitos lidos de `arquivo` (`conteudo` e `estado` são do JSON lido)."""
+    cabecalho = {
+        "versao": VERSAO_CACHE,
+        "tamanho": estado.st_size,
+        "mtime_ns": estado.st_mtime_ns,
+        "hash": hashlib.blake2b(conteudo, digest_size=16).hexdigest(),
+    }
+    caminho = _caminho_cache(arquivo)
+    temporario = f"{caminho}.{os.getpid()}.tmp"  # Outros processos podem estar gerando o mesmo cache
+    try:
+        with open(temporario, "wb") as f:
+            pickle.dump(cabecalho, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump([_leito_para_cache(leito) for leito in leitos], f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+    except OSError:
+        # Sem o cache a inicialização só fica mais lenta; não é motivo para interromper
+        with contextlib.suppress(OSError):
+            os.remove(temporario)
+
+
+# Armazenamento em SQLite
+
+EXTENSOES_SQLITE = (".db", ".sqlite", ".sqlite3")
+
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS leitos (
+    numero TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    paciente TEXT,
+    entrada_ocupacao TEXT,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS historico (
+    numero TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    tipo TEXT,
+    status_anterior TEXT,
+    novo_status TEXT,
+    timestamp TEXT NOT NULL,
+    paciente TEXT,
+    tempo_permanencia TEXT,
+    PRIMARY KEY (numero, indice)
+);
+CREATE INDEX IF NOT EXISTS idx_historico_timestamp ON historico (timestamp);
+"""
+
+_COLUNAS_HISTORICO = ("tipo", "status_anterior", "novo_status", "timestamp", "paciente", "tempo_permanencia")
+
+
+def _eh_banco_sqlite(arquivo):
+    """Indica se `arquivo` deve ser tratado como banco SQLite (pela extensão)."""
+    return arquivo.lower().endswith(EXTENSOES_SQLITE)
+
+
+def _linha_historico(numero, indice, h):
+    h = _serializar_historico(h)
+    return (numero, indice) + tuple(h.get(coluna) for coluna in _COLUNAS_HISTORICO)
+
+
+def _entrada_historico(linha):
+    """Converte uma linha da tabela historico no dicionário usado pelos leitos."""
+    h = {coluna: valor for coluna, valor in zip(_COLUNAS_HISTORICO, linha) if valor is not None}
+    return _desserializar_historico(h)
+
+
+class HistoricoBanco(_HistoricoSobDemanda):
+    """Histórico de um leito lido da tabela `historico` apenas quando percorrido."""
+
+    def __init__(self, banco, numero, total=0):
+        super().__init__(total)
+        self.banco = banco
+        self.numero = numero
+
+    def __repr__(self):
+        return f"HistoricoBanco({self.numero!r}, total={len(self)})"
+
+    def _ler(self, inicio=0):
+        cursor = self.banco.conexao.execute(
+            f"SELECT {', '.join(_COLUNAS_HISTORICO)} FROM historico "
+            "WHERE numero = ? AND indice >= ? AND indice < ? ORDER BY indice",
+            (self.numero, inicio, self.total))
+        for linha in cursor:
+            yield _entrada_historico(linha)
+
+
+class BancoLeitos:
+    """Armazenamento dos leitos em um banco SQLite local.
+
+    Guarda o estado atual na tabela `leitos` e cada mudança de status na tabela
+    `historico` (chave por leito e posição, índice por data). Inscrito como
+    ouvinte de um RegistroLeitos, grava cada evento em sua própria transação.
+    As buscas por número, status e ocupação usam as listas em memória do
+    registro; no banco rodam o histórico por período e a leitura das ocupações
+    para o índice de pacientes.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        # Espera a trava de outros processos em vez de falhar na hora
+        # A conexão pode passar de uma thread para outra (servidor, consultas em paralelo na rede),
+        # mas é usada por uma de cada vez
+        self.conexao = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.executescript(_ESQUEMA_SQLITE)
+        colunas = [linha[1] for linha in self.conexao.execute("PRAGMA table_info(leitos)")]
+        if "versao" not in colunas:  # Bancos criados antes do controle de versão
+            with self.conexao:
+                self.conexao.execute("ALTER TABLE leitos ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+        self._em_transacao = False
+
+    def fechar(self):
+        self.conexao.close()
+
+    def carregar(self):
+        """Monta um RegistroLeitos com o estado atual; o histórico é lido sob demanda."""
+        totais = dict(self.conexao.execute("SELECT numero, COUNT(*) FROM historico GROUP BY numero"))
+        leitos = []
+        for numero, status, paciente, entrada, versao in self.conexao.execute(
+                "SELECT numero, status, paciente, entrada_ocupacao, versao FROM leitos"):
+            leitos.append({"numero": numero, "status": status, "paciente": paciente,
+                           "entrada_ocupacao": datetime.fromisoformat(entrada) if entrada else None,
+                           "historico": HistoricoBanco(self, numero, totais.get(numero, 0)),
+                           "versao": versao})
+        return RegistroLeitos(leitos)
+
+    def salvar(self, leitos):
+        """Sincroniza o banco com todos os leitos em uma única transação."""
+        with self.conexao:
+            totais = dict(self.conexao.execute("SELECT numero, COUNT(*) FROM historico GROUP BY numero"))
+            numeros = set()
+            for leito in leitos:
+                numero = leito["numero"]
+                numeros.add(numero)
+                self._gravar_estado(leito)
+                historico = leito["historico"]
+                inicio = totais.get(numero, 0)
+                if isinstance(historico, _HistoricoSobDemanda):
+                    novas = historico.entradas_desde(inicio)
+                else:
+                    novas = historico[inicio:]
+                self.conexao.executemany(
+                    "INSERT OR IGNORE INTO historico VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [_linha_historico(numero, inicio + i, h) for i, h in enumerate(novas)])
+            removidos = [(numero,) for numero, in self.conexao.execute("SELECT numero FROM leitos")
+                         if numero not in numeros]
+            self.conexao.executemany("DELETE FROM leitos WHERE numero = ?", removidos)
+            self.conexao.executemany("DELETE FROM historico WHERE numero = ?", removidos)
+
+    def _gravar_estado(self, leito):
+        entrada = leito["entrada_ocupacao"]
+        self.conexao.execute(
+            "INSERT INTO leitos (numero, status, paciente, entrada_ocupacao, versao) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (numero) DO UPDATE SET status = excluded.status, paciente = excluded.paciente, "
+            "entrada_ocupacao = excluded.entrada_ocupacao, versao = excluded.versao",
+            (leito["numero"], leito["status"], leito["paciente"], entrada.isoformat() if entrada else None,
+             _versao(leito)))
+
+    @contextlib.contextmanager
+    def transacao(self, leitos, numero=None):
+        """Transação de escrita (BEGIN IMMEDIATE, exclusiva entre processos).
+        Antes de liberar a alteração, atualiza o leito `numero` com o que está no banco.
+        Transações aninhadas (como as de cada operação de um lote) usam a externa."""
+        if self._em_transacao:
+            if numero is not None:
+                self._atualizar_da_base(leitos, str(numero))
+            yield
+            return
+        self.conexao.execute("BEGIN IMMEDIATE")
+        self._em_transacao = True
+        try:
+            if numero is not None:
+                self._atualizar_da_base(leitos, str(numero))
+            yield
+            self.conexao.commit()
+        except BaseException:
+            self.conexao.rollback()
+            leitos.descartar_eventos()
+            raise
+        finally:
+            self._em_transacao = False
+        leitos.confirmar_eventos()
+
+    def _atualizar_da_base(self, leitos, numero):
+        """Traz para a memória o estado do leito gravado por outros processos."""
+        linha = self.conexao.execute(
+            "SELECT status, paciente, entrada_ocupacao, versao FROM leitos WHERE numero = ?", (numero,)).fetchone()
+        leito = leitos.obter(numero)
+        if linha is None:
+            if leito is not None:
+                leitos.remover(numero)
+                leitos.repassar("remover", leito)
+            return
+        status, paciente, entrada, versao = linha
+        novo = leito is None
+        if novo:
+            leito = _novo_leito(numero, leitos.compacto)
+            leito["historico"] = HistoricoBanco(self, numero)
+            leitos.adicionar(leito)
+        elif versao == _versao(leito) and status == leito["status"]:
+            return
+        status_anterior, versao_anterior = leito["status"], _versao(leito)
+        leito["status"] = status
+        leitos.mudou_status(leito, status_anterior)
+        leito["paciente"] = paciente
+        leito["entrada_ocupacao"] = datetime.fromisoformat(entrada) if entrada else None
+        leito["versao"] = versao
+        historico = leito["historico"]
+        if isinstance(historico, HistoricoBanco):
+            tamanho_anterior = len(historico)
+            historico.total = self.conexao.execute(
+                "SELECT COUNT(*) FROM historico WHERE numero = ?", (numero,)).fetchone()[0]
+            historico._entradas = None
+            historico._pendentes = []
+            # O histórico é relido do banco: as linhas de exibição guardadas deixam de valer
+            leitos.cache_historico().descartar(numero)
+            if not novo and historico.total != tamanho_anterior + versao - versao_anterior:
+                # Cada transição soma uma entrada e uma versão; se faltam entradas, outro
+                # processo as moveu para o arquivo morto e as posições indexadas mudaram
+                leitos.encurtou_historico(leito)
+        leitos.registrou_historico(leito)
+        if novo:
+            leitos.repassar("adicionar", leito)
+        elif _houve_transicao(leito, status_anterior, versao_anterior):
+            ultima = self.conexao.execute(
+                f"SELECT {', '.join(_COLUNAS_HISTORICO)} FROM historico WHERE numero = ? ORDER BY indice DESC LIMIT 1",
+                (numero,)).fetchone()
+            leitos.repassar("transicao", leito, _entrada_historico(ultima) if ultima else None)
+
+    def sincronizar(self, leitos):
+        """Traz para a memória os leitos adicionados, removidos ou alterados por outros processos."""
+        gravados = dict(self.conexao.execute("SELECT numero, versao FROM leitos"))
+        alterados = [numero for numero, versao in gravados.items()
+                     if numero not in leitos or versao != _versao(leitos.obter(numero))]
+        alterados += [leito["numero"] for leito in leitos if leito["numero"] not in gravados]
+        for numero in sorted(alterados, key=_chave_ordenacao):
+            self._atualizar_da_base(leitos, numero)
+
+    def __call__(self, evento, leito, entrada=None):
+        """Ouvinte do RegistroLeitos: grava o evento na transação em andamento
+        (ou em uma transação própria, se não houver)."""
+        if self._em_transacao:
+            self._gravar_evento(evento, leito, entrada)
+        else:
+            with self.conexao:
+                self._gravar_evento(evento, leito, entrada)
+
+    def _gravar_evento(self, evento, leito, entrada):
+        if evento == "remover":
+            self.conexao.execute("DELETE FROM leitos WHERE numero = ?", (leito["numero"],))
+            self.conexao.execute("DELETE FROM historico WHERE numero = ?", (leito["numero"],))
+            return
+        self._gravar_estado(leito)
+        if evento == "transicao":
+            self.conexao.execute("INSERT OR IGNORE INTO historico VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 _linha_historico(leito["numero"], len(leito["historico"]) - 1, entrada))
+
+    def descartar_historico(self, leito, quantidade):
+        """Apaga as `quantidade` primeiras entradas do histórico do leito (já no arquivo
+        morto) e renumera as demais. Chamar dentro de transacao(). A versão do leito
+        avança para que os outros processos releiam o histórico dele; status, paciente
+        e entrada continuam os gravados no banco."""
+        numero = leito["numero"]
+        self.conexao.execute("DELETE FROM historico WHERE numero = ? AND indice < ?", (numero, quantidade))
+        # Em dois passos (negativos e de volta) para não colidir com a chave (numero, indice)
+        self.conexao.execute("UPDATE historico SET indice = ? - 1 - indice WHERE numero = ?", (quantidade, numero))
+        self.conexao.execute("UPDATE historico SET indice = -1 - indice WHERE numero = ?", (numero,))
+        leito["historico"] = HistoricoBanco(self, numero, len(leito["historico"]) - quantidade)
+        leito["versao"] = _versao(leito) + 1
+        self.conexao.execute("UPDATE leitos SET versao = ? WHERE numero = ?", (leito["versao"], numero))
+
+    # Consultas (retornam entradas de histórico)
+
+    def entradas_de_ocupacao(self):
+        """Entradas do histórico que abrem ou fecham uma ocupação, como (numero, posição, entrada),
+        em ordem de leito e de posição, com os timestamps em texto (para IndicePacientes.de_entradas)."""
+        cursor = self.conexao.execute(
+            "SELECT numero, indice, status_anterior, novo_status, timestamp, paciente FROM historico "
+            "WHERE novo_status = 'Ocupado' OR status_anterior = 'Ocupado' ORDER BY numero, indice")
+        for numero, indice, anterior, novo, timestamp, paciente in cursor:
+            yield numero, indice, {"status_anterior": anterior, "novo_status": novo, "timestamp": timestamp,
+                                   "paciente": paciente}
+
+    def historico_periodo(self, inicio, fim, numero=None):
+        """Entradas de histórico com timestamp em [inicio, fim], como pares (numero, entrada)."""
+        sql = f"SELECT numero, {', '.join(_COLUNAS_HISTORICO)} FROM historico WHERE timestamp BETWEEN ? AND ?"
+        parametros = [inicio.isoformat(), fim.isoformat()]
+        if numero is not None:
+            sql += " AND numero = ?"
+            parametros.append(str(numero))
+        sql += " ORDER BY timestamp"
+        return [(linha[0], _entrada_historico(linha[1:])) for linha in self.conexao.execute(sql, parametros)]
+
+
+def _banco_para(leitos, arquivo):
+    """Reaproveita o banco já aberto pelo registro, se for o mesmo arquivo."""
+    banco = getattr(leitos, "banco", None)
+    if banco and os.path.abspath(banco.caminho) == os.path.abspath(arquivo):
+        return banco
+    return BancoLeitos(arquivo)
+
+
+@_medido("historico_por_periodo")
+def historico_por_periodo(leitos, inicio, fim, numero=None, incluir_arquivado=False, arquivo=None):
+    """Retorna as mudanças de status entre `inicio` e `fim` como pares (numero, entrada).
+    Usa o índice por data do banco quando os leitos vierem de um arquivo SQLite.
+    Com incluir_arquivado=True, inclui as entradas do arquivo morto (ver arquivar_historico)."""
+    banco = getattr(leitos, "banco", None)
+    if banco:
+        resultados = banco.historico_periodo(inicio, fim, numero)
+    else:
+        resultados = []
+        for leito in _leitos_ordenados(leitos):
+            if numero is not None and leito["numero"] != str(numero):
+                continue
+            for h in leito["historico"]:
+                if inicio <= h["timestamp"] <= fim:
+                    resultados.append((leito["numero"], h))
+    if incluir_arquivado:
+        resultados.extend(ler_arquivo_morto(_arquivo_dos_leitos(leitos, arquivo), inicio, fim, numero))
+    resultados.sort(key=lambda par: par[1]["timestamp"])
+    return resultados
+
+
+def exportar_historico(leitos, destino, inicio=None, fim=None, numero=None, incluir_arquivado=False, arquivo=None):
+    """Grava em CSV (numero + colunas do histórico) as mudanças de status do período,
+    em ordem cronológica; sem período, todas. Retorna quantas entradas foram exportadas."""
+    pares = historico_por_periodo(leitos, inicio or datetime.min, fim or datetime.max, numero,
+                                  incluir_arquivado, arquivo)
+    with open(destino, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(("numero",) + _COLUNAS_HISTORICO)
+        for numero_leito, h in pares:
+            linha = _linha_historico(numero_leito, 0, h)
+            escritor.writerow(linha[:1] + linha[2:])  # Sem a posição no histórico
+    print(f"{len(pares)} entrada(s) do histórico exportada(s) para {destino}.")
+    return len(pares)
+
+
+# Arquivo morto do histórico (retenção)
+
+def _arquivo_dos_leitos(leitos, arquivo=None):
+    """Arquivo de onde os leitos foram carregados, se `arquivo` não for informado."""
+    return arquivo or getattr(leitos, "arquivo", None) or "leitos.json"
+
+
+def _diretorio_arquivo_morto(arquivo):
+    """Diretório com o histórico arquivado de um arquivo de leitos (um .jsonl.gz por mês)."""
+    return os.path.splitext(arquivo)[0] + "_arquivo_morto"
+
+
+def _caminho_particao(diretorio, mes):
+    """Partição do mês "AAAA-MM" (o início do timestamp ISO das entradas)."""
+    return os.path.join(diretorio, f"historico-{mes}.jsonl.gz")
+
+
+def _mes_da_particao(nome):
+    """(ano, mês) de uma partição pelo nome do arquivo, ou None se não for uma partição."""
+    if not (nome.startswith("historico-") and nome.endswith(".jsonl.gz")):
+        return None
+    try:
+        ano, mes = nome[len("historico-"):-len(".jsonl.gz")].split("-")
+        return int(ano), int(mes)
+    except ValueError:
+        return None
+
+
+def _anexar_particao(caminho, linhas):
+    """Acrescenta as linhas à partição como um novo membro gzip, trocando o arquivo
+    de uma vez: uma gravação interrompida não corrompe o que já estava arquivado."""
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        with contextlib.suppress(FileNotFoundError), open(caminho, "rb") as atual:
+            shutil.copyfileobj(atual, f)  # Membros anteriores, sem descompactar
+        f.write(gzip.compress("".join(linhas).encode("utf-8"), compresslevel=6))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+def ler_arquivo_morto(arquivo="leitos.json", inicio=None, fim=None, numero=None):
+    """Entradas arquivadas de `arquivo` como pares (numero, entrada), mês a mês.
+
+    Só são abertas as partições dos meses que se sobrepõem a [inicio, fim].
+    Entradas arquivadas duas vezes (queda entre o arquivamento e a gravação
+    dos leitos) aparecem uma vez só.
+    """
+    diretorio = _diretorio_arquivo_morto(arquivo)
+    try:
+        nomes = sorted(os.listdir(diretorio))
+    except FileNotFoundError:
+        return
+    numero = str(numero) if numero is not None else None
+    ultimos = {}  # numero -> timestamp da última entrada lida do leito
+    for nome in nomes:
+        mes = _mes_da_particao(nome)
+        if mes is None:
+            continue
+        if inicio is not None and mes < (inicio.year, inicio.month):
+            continue
+        if fim is not None and mes > (fim.year, fim.month):
+            continue
+        with gzip.open(os.path.join(diretorio, nome), "rt", encoding="utf-8") as f:
+            for linha in f:
+                h = json.loads(linha)
+                numero_leito = h.pop("numero")
+                if numero is not None and numero_leito != numero:
+                    continue
+                _desserializar_historico(h)
+                # O histórico de cada leito é cronológico: o que não avança já foi lido
+                if numero_leito in ultimos and h["timestamp"] <= ultimos[numero_leito]:
+                    continue
+                ultimos[numero_leito] = h["timestamp"]
+                if (inicio is None or h["timestamp"] >= inicio) and (fim is None or h["timestamp"] <= fim):
+                    yield numero_leito, h
+
+
+def _quantas_arquivar(entradas, limite, maximo):
+    """Quantas entradas do início do histórico saem pela retenção: as anteriores a
+    `limite` e as que passam das `maximo` mais recentes."""
+    quantidade = max(len(entradas) - maximo, 0) if maximo is not None else 0
+    if limite is not None:
+        while quantidade < len(entradas) and _para_datetime(entradas[quantidade]["timestamp"]) < limite:
+            quantidade += 1
+    return quantidade
+
+
+def _historico_sem_antigas(historico, entradas, quantidade):
+    """O histórico sem as `quantidade` primeiras de suas `entradas`, no mesmo tipo de armazenamento."""
+    restantes = entradas[quantidade:]
+    if isinstance(historico, HistoricoLeito):
+        # Regravado por inteiro (a partir do byte 0) no próximo salvamento
+        novo = HistoricoLeito(historico.caminho)
+        novo._entradas = []
+        novo._pendentes = restantes
+        return novo
+    if isinstance(historico, HistoricoAdiado) and historico._entradas is None:
+        return HistoricoAdiado(restantes)  # Continua sem converter os timestamps
+    if isinstance(historico, HistoricoColunar):
+        return HistoricoColunar(restantes)
+    return restantes
+
+
+@contextlib.contextmanager
+def _diario_presente(leitos, arquivo):
+    """Associa aos leitos, durante a operação, o diário de `arquivo` deixado por outra sessão
+    (quando não houve ativar_diario): ele é travado, aplicado e pode ser zerado como um diário ativo."""
+    if (not isinstance(leitos, RegistroLeitos) or leitos.diario is not None or leitos.banco is not None
+            or not os.path.exists(_caminho_diario(arquivo))):
+        yield
+        return
+    leitos.diario = DiarioLeitos(leitos, arquivo, limite_compactacao=0)
+    try:
+        yield
+    finally:
+        leitos.diario.fechar()
+        leitos.diario = None
+
+
+@_medido("arquivar_historico")
+def arquivar_historico(leitos, arquivo=None, dias=None, maximo=None, agora=None):
+    """Aplica a retenção do histórico: as entradas com mais de `dias` dias, ou além das
+    `maximo` mais recentes de cada leito, vão para o arquivo morto compactado
+    (<arquivo>_arquivo_morto/historico-AAAA-MM.jsonl.gz, uma partição por mês).
+
+    O arquivo morto é gravado antes; depois os leitos são gravados já sem essas
+    entradas (snapshot novo e diário zerado, ou uma transação no SQLite), então
+    salvar e carregar passam a depender só do histórico recente. As entradas
+    arquivadas continuam acessíveis por visualizar_historico, historico_por_periodo
+    e exportar_historico com incluir_arquivado=True. Retorna quantas foram movidas.
+    """
+    if dias is None and maximo is None:
+        return 0
+    arquivo = _arquivo_dos_leitos(leitos, arquivo)
+    limite = (agora or datetime.now()) - timedelta(days=dias) if dias is not None else None
+    banco = getattr(leitos, "banco", None)
+    diretorio = _diretorio_arquivo_morto(arquivo)
+    # Um diário existente precisa ser zerado junto: as posições do histórico gravadas nele deixam de valer
+    with _diario_presente(leitos, arquivo), _transacao(leitos):
+        if banco:
+            # Sem um leito específico a transação não relê nenhum: traz todos antes de cortar
+            banco.sincronizar(leitos)
+        particoes = {}  # mês "AAAA-MM" -> linhas
+        cortes = []     # (leito, entradas do histórico, quantidade arquivada)
+        for leito in leitos:
+            historico = leito["historico"]
+            if limite is None and len(historico) <= maximo:
+                continue  # Nada a arquivar, sem precisar ler o histórico
+            # Históricos ainda não convertidos são lidos no formato do JSON, sem criar datetimes
+            entradas = _entradas_desde(historico, 0)
+            quantidade = _quantas_arquivar(entradas, limite, maximo)
+            if not quantidade:
+                continue
+            for h in entradas[:quantidade]:
+                h = _serializar_historico(h)
+                particoes.setdefault(h["timestamp"][:7], []).append(
+                    json.dumps({"numero": leito["numero"], **h}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            cortes.append((leito, entradas, quantidade))
+        if not cortes:
+            return 0
+
+        os.makedirs(diretorio, exist_ok=True)
+        for mes, linhas in particoes.items():
+            _anexar_particao(_caminho_particao(diretorio, mes), linhas)
+
+        originais = [(leito, leito["historico"], leito.get("versao")) for leito, _, _ in cortes]
+        try:
+            for leito, entradas, quantidade in cortes:
+                if banco:
+                    banco.descartar_historico(leito, quantidade)
+                else:
+                    leito["historico"] = _historico_sem_antigas(leito["historico"], entradas, quantidade)
+            if not banco:
+                _gravar_snapshot(leitos, arquivo)
+                diario = getattr(leitos, "diario", None)
+                if diario and os.path.abspath(diario.arquivo) == os.path.abspath(arquivo):
+                    diario.truncar()  # As posições do histórico no diário deixaram de valer
+        except BaseException:
+            # Os leitos continuam com o histórico inteiro (o que já foi para o arquivo
+            # morto é descartado na leitura como repetido)
+            for leito, historico, versao in originais:
+                if isinstance(historico, HistoricoLeito):
+                    # O arquivo do leito pode já ter sido regravado: volta a ser gravado inteiro
+                    historico = _historico_sem_antigas(historico, historico.carregar(), 0)
+                leito["historico"] = historico
+                leito["versao"] = versao
+            raise
+        finally:
+            if isinstance(leitos, RegistroLeitos):
+                for leito, _, _ in cortes:
+                    leitos.encurtou_historico(leito)
+    movidas = sum(quantidade for _, _, quantidade in cortes)
+    print(f"{movidas} entrada(s) do histórico movida(s) para o arquivo morto ({diretorio}).")
+    return movidas
+
+
+# Diário de eventos (write-ahead log)
+
+def _caminho_diario(arquivo):
+    """Caminho do diário de eventos associado a um arquivo de leitos."""
+    return arquivo + ".diario"
+
+
+def _aplicar_evento(leitos, registro):
+    """Aplica um registro do diário ao registro de leitos.
+
+    A aplicação é idempotente: uma transição só é aplicada se o histórico do
+    leito ainda não contém a entrada na posição registrada, o que permite
+    reaplicar o diário sobre um snapshot que já inclui parte dele.
+    """
+    evento = registro["evento"]
+    numero = registro["numero"]
+    if evento == "adicionar":
+        if numero not in leitos:
+            leito = _novo_leito(numero, leitos.compacto)
+            leitos.adicionar(leito)
+            leitos.repassar("adicionar", leito)
+    elif evento == "remover":
+        leito = leitos.remover(numero)
+        if leito is not None:
+            leitos.repassar("remover", leito)
+    elif evento == "transicao":
+        leito = leitos.obter(numero)
+        if leito is None or len(leito["historico"]) > registro["indice"]:
+            return
+        status_anterior = leito["status"]
+        leito["status"] = registro["status"]
+        leitos.mudou_status(leito, status_anterior)
+        leito["paciente"] = registro["paciente"]
+        entrada = registro["entrada_ocupacao"]
+        leito["entrada_ocupacao"] = datetime.fromisoformat(entrada) if entrada else None
+        leito["versao"] = registro.get("versao", _versao(leito) + 1)
+        entrada = _desserializar_historico(registro["historico"])
+        leito["historico"].append(entrada)
+        leitos.registrou_historico(leito)
+        leitos.repassar("transicao", leito, entrada)
+
+
+def _reaplicar_diario(leitos, caminho, inicio=0):
+    """Reaplica os eventos do diário em `caminho` a partir do byte `inicio`.
+    Retorna (quantidade de eventos lidos, posição logo após o último evento completo)."""
+    try:
+        f = open(caminho, "rb")
+    except FileNotFoundError:
+        return 0, 0
+    lidos = 0
+    posicao = inicio
+    with f:
+        f.seek(inicio)
+        for linha in f:
+            try:
+                if not linha.endswith(b"\n"):
+                    raise ValueError("linha incompleta")
+                registro = json.loads(linha)
+            except ValueError:
+                # Última linha incompleta (queda durante a escrita): descarta
+                break
+            _aplicar_evento(leitos, registro)
+            lidos += 1
+            posicao += len(linha)
+    return lidos, posicao
+
+
+# Travas entre processos (fcntl no Linux/macOS, msvcrt no Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def _travar_arquivo(f):
+    """Trava exclusiva e bloqueante sobre o arquivo aberto `f`."""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue  # LK_LOCK desiste após ~10s; continua esperando
+
+
+def _destravar_arquivo(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _caminho_trava(arquivo):
+    """Arquivo de trava compartilhado; guarda também a geração do diário."""
+    return arquivo + ".trava"
+
+
+def _ler_geracao(caminho_trava):
+    try:
+        with open(caminho_trava, "rb") as f:
+            conteudo = f.read().strip()
+    except FileNotFoundError:
+        return 0
+    return int(conteudo) if conteudo else 0
+
+
+class DiarioLeitos:
+    """Diário de eventos em JSON Lines, gravado a cada transição.
+
+    Cada evento (adição, remoção ou mudança de status) vira uma linha compacta
+    anexada ao arquivo e sincronizada com fsync, então o custo de escrita é
+    constante, independente do tamanho do histórico. Ao atingir
+    `limite_compactacao` eventos, o diário é incorporado a um novo snapshot.
+
+    Vários processos podem usar o mesmo arquivo: cada escrita acontece dentro
+    de `transacao()`, que trava `<arquivo>.trava` e antes aplica os eventos que
+    os outros processos anexaram desde a última leitura. Os eventos de uma
+    transação (por exemplo, um lote inteiro) são gravados com um só fsync. A trava guarda a
+    geração do diário, incrementada a cada compactação; quem encontra uma
+    geração diferente da sua recarrega o snapshot.
+    """
+
+    def __init__(self, leitos, arquivo="leitos.json", limite_compactacao=1000):
+        self.leitos = leitos
+        self.arquivo = arquivo
+        self.caminho = _caminho_diario(arquivo)
+        self.limite_compactacao = limite_compactacao
+        self._trava = open(_caminho_trava(arquivo), "a+b")
+        self._f = open(self.caminho, "ab")
+        # Até onde este processo já leu o diário (definido por carregar_leitos)
+        self._geracao, self._posicao = getattr(leitos, "posicao_diario", None) or (None, 0)
+        # Sem posição conhecida, os eventos serão contados ao reler o diário
+        self.eventos = _contar_linhas(self.caminho) if self._posicao else 0
+        self._profundidade = 0
+        self._pendentes = []
+
+    @contextlib.contextmanager
+    def transacao(self):
+        """Trava o diário entre processos e aplica os eventos gravados pelos demais.
+        Os eventos da transação são gravados juntos, com um único fsync, ao final."""
+        if self._profundidade == 0:
+            _travar_arquivo(self._trava)
+            try:
+                self.sincronizar()
+            except BaseException:
+                _destravar_arquivo(self._trava)
+                raise
+        self._profundidade += 1
+        try:
+            yield
+        finally:
+            self._profundidade -= 1
+            if self._profundidade == 0:
+                try:
+                    self._gravar_pendentes()
+                finally:
+                    _destravar_arquivo(self._trava)
+
+    def sincronizar(self):
+        """Aplica os eventos anexados por outros processos (chamar com a trava obtida)."""
+        geracao = _ler_geracao(self._trava.name)
+        if self._geracao is not None and geracao != self._geracao:
+            # Outro processo compactou o diário: o snapshot já tem tudo
+            self._recarregar()
+        else:
+            lidos, self._posicao = _reaplicar_diario(self.leitos, self.caminho, self._posicao)
+            self.eventos += lidos
+        self._geracao = geracao
+
+    def _recarregar(self):
+        novos = _carregar_snapshot(self.arquivo)
+        if self.leitos.compacto:
+            compactar_leitos(novos)
+        self.eventos, self._posicao = _reaplicar_diario(novos, self.caminho)
+        anteriores = {leito["numero"]: leito for leito in self.leitos}
+        self.leitos._indexar(list(novos))
+        self.leitos.historico_separado = novos.historico_separado
+        # O que mudou desde a última leitura vai para os ouvintes (como o feed de eventos)
+        for leito in novos:
+            anterior = anteriores.pop(leito["numero"], None)
+            if anterior is None:
+                self.leitos.repassar("adicionar", leito)
+            elif _versao(leito) != _versao(anterior) and _houve_transicao(leito, anterior["status"], _versao(anterior)):
+                historico = leito["historico"]
+                self.leitos.repassar("transicao", leito, historico[len(historico) - 1] if historico else None)
+        for anterior in anteriores.values():
+            self.leitos.repassar("remover", anterior)
+
+    def __call__(self, evento, leito, entrada=None):
+        registro = {"evento": evento, "numero": leito["numero"]}
+        if evento == "transicao":
+            registro["indice"] = len(leito["historico"]) - 1
+            registro["status"] = leito["status"]
+            registro["paciente"] = leito["paciente"]
+            registro["entrada_ocupacao"] = leito["entrada_ocupacao"].isoformat() if leito["entrada_ocupacao"] else None
+            registro["versao"] = _versao(leito)
+            registro["historico"] = _serializar_historico(entrada)
+        linha = json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self.transacao():
+            self._pendentes.append(linha.encode("utf-8"))
+
+    def _gravar_pendentes(self):
+        """Anexa os eventos da transação ao diário (com a trava obtida)."""
+        if not self._pendentes:
+            return
+        self._f.write(b"".join(self._pendentes))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._posicao = self._f.tell()
+        self.eventos += len(self._pendentes)
+        self._pendentes = []
+        self.leitos.confirmar_eventos()
+        if self.limite_compactacao and self.eventos >= self.limite_compactacao:
+            _gravar_snapshot(self.leitos, self.arquivo)
+            self._zerar()
+
+    def compactar(self):
+        """Incorpora o diário a um novo snapshot e zera o diário."""
+        with self.transacao():
+            _gravar_snapshot(self.leitos, self.arquivo)
+            self._zerar()
+
+    def truncar(self):
+        """Descarta os eventos já incorporados ao snapshot e avança a geração."""
+        with self.transacao():
+            self._zerar()
+
+    def _zerar(self):
+        # O snapshot recém-gravado já contém os eventos pendentes
+        self._pendentes = []
+        self.leitos.confirmar_eventos()
+        self._f.truncate(0)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._geracao = (self._geracao or 0) + 1
+        self._trava.truncate(0)
+        self._trava.write(str(self._geracao).encode("ascii"))
+        self._trava.flush()
+        os.fsync(self._trava.fileno())
+        self._posicao = 0
+        self.eventos = 0
+
+    def fechar(self):
+        self._f.close()
+        self._trava.close()
+
+
+def _contar_linhas(caminho):
+    try:
+        with open(caminho, "rb") as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+def ativar_diario(leitos, arquivo="leitos.json", limite_compactacao=1000):
+    """Passa a registrar cada evento dos leitos no diário associado a `arquivo`."""
+    diario = DiarioLeitos(leitos, arquivo, limite_compactacao)
+    leitos.diario = diario
+    leitos.inscrever(diario)
+    return diario
 
 
 # Funções de manipulação de leitos 
 
 def encontrar_leito(leitos, numero):
     """Auxiliar para encontrar um leito pelo número."""
+    if isinstance(leitos, RegistroLeitos):
+        return leitos.obter(numero)  # Busca direta no índice
     for leito in leitos:
         # Garante que a comparação seja entre strings
         if str(leito["numero"]) == str(numero):
@@ -75,8 +2277,17 @@ def encontrar_leito(leitos, numero):
     return None
 
 
-def _atualizar_status_leito(leito, novo_status, paciente=None):
-    """Função auxiliar para atualizar o status do leito e registrar no histórico."""
+def _novo_leito(numero, compacto=False):
+    """Cria um leito vazio com status 'Disponível' (dicionário, ou Leito se compacto)."""
+    if compacto:
+        return Leito(numero)
+    return {"numero": numero, "status": "Disponível", "paciente": None, "entrada_ocupacao": None, "historico": [],
+            "versao": 0}
+
+
+def _atualizar_status_leito(leito, novo_status, paciente=None, leitos=None):
+    """Função auxiliar para atualizar o status do leito e registrar no histórico.
+    Se `leitos` for um RegistroLeitos, a transição é repassada aos seus ouvintes."""
    
     status_anterior = leito["status"]
 
@@ -89,6 +2300,7 @@ def _atualizar_status_leito(leito, novo_status, paciente=None):
     }
 
     leito["status"] = novo_status
+    leito["versao"] = _versao(leito) + 1  # Controle otimista de concorrência
 
     if novo_status == "Ocupado":
         leito["paciente"] = paciente
@@ -123,119 +2335,495 @@ def _atualizar_status_leito(leito, novo_status, paciente=None):
         print(f"Leito {leito['numero']} agora está {novo_status}.")
 
     leito["historico"].append(historico_entry)
+    if METRICAS is not None:
+        METRICAS.contar_transicao(status_anterior, novo_status)
+    if isinstance(leitos, RegistroLeitos):
+        leitos.notificar("transicao", leito, historico_entry)
+
+
+def _transacao(leitos, numero=None):
+    """Contexto de escrita: trava o armazenamento compartilhado e traz as alterações
+    feitas por outros processos (nada a fazer para listas simples)."""
+    if isinstance(leitos, RegistroLeitos):
+        return leitos.transacao(numero)
+    return contextlib.nullcontext()
 
 
+@_medido("adicionar_leito")
 def adicionar_leito(leitos, numero):
     """Adiciona um novo leito à lista com status 'Disponível'."""
     # Garante que o número seja tratado como string ao adicionar
     numero_str = str(numero).strip()
-    if encontrar_leito(leitos, numero_str):
-        print(f"Erro: Leito {numero_str} já existe.")
-        return
-    leito = {"numero": numero_str, "status": "Disponível", "paciente": None, "entrada_ocupacao": None, "historico": []}
-    leitos.append(leito)
-    leitos.sort(key=lambda x: int(x["numero"]))  # Mantém a lista ordenada por número
+    with _transacao(leitos, numero_str):
+        if encontrar_leito(leitos, numero_str):
+            print(f"Erro: Leito {numero_str} já existe.")
+            return False
+        leito = _novo_leito(numero_str, getattr(leitos, "compacto", False))
+        if isinstance(leitos, RegistroLeitos):
+            leitos.adicionar(leito)  # Inserção já na posição ordenada
+            leitos.notificar("adicionar", leito)
+        else:
+            leitos.append(leito)
+            leitos.sort(key=lambda x: _chave_ordenacao(x["numero"]))  # Mantém a lista ordenada por número
     print(f"Leito {numero_str} adicionado.")
+    return True
 
 
-def remover_leito(leitos, numero):
+@_medido("remover_leito")
+def remover_leito(leitos, numero, confirmar=True):
     """Remove um leito existente, se não estiver ocupado."""
     numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
+    if not encontrar_leito(leitos, numero_str):
+        print(f"Leito {numero_str} não encontrado.")
+        return False
+    if confirmar:
         confirmacao = input(f"Tem certeza que deseja remover o leito {numero_str}? (s/n): ").lower().strip()
-        if confirmacao == 's':
-            if leito["status"] == "Ocupado":
-                print(f"Erro: Leito {numero_str} está ocupado. Libere-o antes de remover.")
-            else:
-                leitos.remove(leito)
-                print(f"Leito {numero_str} removido com sucesso.")
-        else:
+        if confirmacao != 's':
             print("Remoção de leito cancelada.")
-    else:
-        print(f"Leito {numero_str} não encontrado.")
+            return False
+    # A confirmação fica fora da trava; o estado é conferido de novo lá dentro
+    with _transacao(leitos, numero_str):
+        leito = encontrar_leito(leitos, numero_str)
+        if not leito:
+            print(f"Leito {numero_str} não encontrado.")
+            return False
+        if leito["status"] == "Ocupado":
+            print(f"Erro: Leito {numero_str} está ocupado. Libere-o antes de remover.")
+            return False
+        if isinstance(leitos, RegistroLeitos):
+            leitos.remover(numero_str)
+            leitos.notificar("remover", leito)
+        else:
+            leitos.remove(leito)
+    print(f"Leito {numero_str} removido com sucesso.")
+    return True
 
 
-def ocupar_leito(leitos, numero, paciente):
-    """Ocupa um leito com um paciente."""
+# Máquina de estados: ação -> (status de origem permitidos, novo status, mensagem de recusa)
+TRANSICOES = {
+    "ocupar": (STATUS_LIVRES, "Ocupado", "não está disponível para ocupação"),
+    "liberar": (("Ocupado",), "Leito Pronto", "não está ocupado"),
+    "iniciar_limpeza": (STATUS_LIVRES, "Em Limpeza", "não pode iniciar limpeza"),
+    "finalizar_limpeza": (("Em Limpeza",), "Leito Pronto", "não está em limpeza"),
+    "iniciar_manutencao": (STATUS_LIVRES, "Em Manutenção", "não pode iniciar manutenção"),
+    "finalizar_manutencao": (("Em Manutenção",), "Leito Pronto", "não está em manutenção"),
+}
+
+
+def _versao(leito):
+    return leito.get("versao") or 0
+
+
+@_medido("executar_transicao")
+def executar_transicao(leitos, numero, acao, paciente=None, versao_esperada=None):
+    """Aplica uma ação da máquina de estados (ver TRANSICOES) a um leito.
+
+    A validação é feita dentro da transação, depois de trazer as alterações de
+    outros operadores. Se `versao_esperada` for informada e o leito estiver em
+    outra versão, a transição é recusada como conflito (controle otimista).
+    Retorna um dicionário com "sucesso", "erro" (None, "nao_encontrado",
+    "status_invalido" ou "conflito") e "mensagem".
+    """
     numero_str = str(numero).strip() # Garante que o número seja tratado como string
+    origens, novo_status, recusa = TRANSICOES[acao]
     leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] in ["Disponível", "Leito Pronto"]:
-            _atualizar_status_leito(leito, "Ocupado", paciente)
-        else:
-            print(f"Leito {numero_str} não está disponível para ocupação. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+    # Versão que o operador tinha em mãos antes de sincronizar com os demais
+    versao_vista = versao_esperada if versao_esperada is not None else (_versao(leito) if leito else None)
+    with _transacao(leitos, numero_str):
+        leito = encontrar_leito(leitos, numero_str)
+        if not leito:
+            return {"sucesso": False, "erro": "nao_encontrado", "mensagem": f"Leito {numero_str} não encontrado."}
+        versao_atual = _versao(leito)
+        alterado = versao_vista is not None and versao_atual != versao_vista
+        if alterado and (versao_esperada is not None or leito["status"] not in origens):
+            return {"sucesso": False, "erro": "conflito",
+                    "mensagem": f"Conflito: leito {numero_str} foi alterado por outro operador "
+                                f"(versão {versao_atual}, status atual: {leito['status']})."}
+        if leito["status"] not in origens:
+            return {"sucesso": False, "erro": "status_invalido",
+                    "mensagem": f"Leito {numero_str} {recusa}. Status atual: {leito['status']}."}
+        if acao == "liberar":
+            paciente = leito["paciente"]  # Passa o nome do paciente para registro
+        _atualizar_status_leito(leito, novo_status, paciente, leitos=leitos)
+        return {"sucesso": True, "erro": None, "mensagem": None, "versao": _versao(leito)}
+
+
+def _transicao_interativa(leitos, numero, acao, paciente=None, versao_esperada=None):
+    """Executa a transição e exibe a mensagem de recusa, como nas telas do menu."""
+    resultado = executar_transicao(leitos, numero, acao, paciente, versao_esperada)
+    if not resultado["sucesso"]:
+        print(resultado["mensagem"])
+    return resultado["sucesso"]
+
+
+def ocupar_leito(leitos, numero, paciente, versao_esperada=None):
+    """Ocupa um leito com um paciente."""
+    return _transicao_interativa(leitos, numero, "ocupar", paciente, versao_esperada)
 
 
-def liberar_leito(leitos, numero):
+def liberar_leito(leitos, numero, versao_esperada=None):
     """Libera um leito ocupado e registra o tempo de permanência."""
-    numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] == "Ocupado":
-            _atualizar_status_leito(leito, "Leito Pronto", leito["paciente"])  # Passa o nome do paciente para registro
-        else:
-            print(f"Leito {numero_str} não está ocupado. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+    return _transicao_interativa(leitos, numero, "liberar", versao_esperada=versao_esperada)
 
 
-def iniciar_limpeza(leitos, numero):
+def iniciar_limpeza(leitos, numero, versao_esperada=None):
     """Altera o status do leito para 'Em Limpeza'."""
-    numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] in ["Disponível", "Leito Pronto"]:
-            _atualizar_status_leito(leito, "Em Limpeza")
-        else:
-            print(f"Leito {numero_str} não pode iniciar limpeza. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+    return _transicao_interativa(leitos, numero, "iniciar_limpeza", versao_esperada=versao_esperada)
 
 
-def finalizar_limpeza(leitos, numero):
+def finalizar_limpeza(leitos, numero, versao_esperada=None):
     """Altera o status do leito de 'Em Limpeza' para 'Leito Pronto'."""
-    numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] == "Em Limpeza":
-            _atualizar_status_leito(leito, "Leito Pronto")
-        else:
-            print(f"Leito {numero_str} não está em limpeza. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+    return _transicao_interativa(leitos, numero, "finalizar_limpeza", versao_esperada=versao_esperada)
 
 
-def iniciar_manutencao(leitos, numero):
+def iniciar_manutencao(leitos, numero, versao_esperada=None):
     """Altera o status do leito para 'Em Manutenção'."""
-    numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] in ["Disponível", "Leito Pronto"]:
-            _atualizar_status_leito(leito, "Em Manutenção")
-        else:
-            print(f"Leito {numero_str} não pode iniciar manutenção. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+    return _transicao_interativa(leitos, numero, "iniciar_manutencao", versao_esperada=versao_esperada)
 
 
-def finalizar_manutencao(leitos, numero):
+def finalizar_manutencao(leitos, numero, versao_esperada=None):
     """Altera o status do leito de 'Em Manutenção' para 'Leito Pronto'."""
-    numero_str = str(numero).strip() # Garante que o número seja tratado como string
-    leito = encontrar_leito(leitos, numero_str)
-    if leito:
-        if leito["status"] == "Em Manutenção":
-            _atualizar_status_leito(leito, "Leito Pronto")
+    return _transicao_interativa(leitos, numero, "finalizar_manutencao", versao_esperada=versao_esperada)
+
+
+# Operações em lote
+
+def ler_operacoes(caminho):
+    """Lê operações de lote de um arquivo CSV (cabeçalho numero,acao,paciente[,versao])
+    ou JSON Lines (um objeto por linha com as mesmas chaves).
+    Os valores não são convertidos aqui: uma versão ou um paciente inválido vira o
+    erro daquela operação em aplicar_lote(), sem impedir a leitura das demais."""
+    with open(caminho, "r", encoding="utf-8", newline="") as f:
+        if caminho.lower().endswith(".csv"):
+            # Células vazias (como a versão não informada) valem como ausentes
+            return [{chave: valor if valor != "" else None for chave, valor in linha.items()}
+                    for linha in csv.DictReader(f)]
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def versao_esperada(valor):
+    """Versão informada por um operador como inteiro (aceita também texto com dígitos, "3").
+    None continua None; qualquer outro valor gera ValueError."""
+    if valor is None or (isinstance(valor, int) and not isinstance(valor, bool)):
+        return valor
+    if isinstance(valor, str) and valor.strip().isdigit():
+        return int(valor)
+    raise ValueError(f"Versão inválida: {valor!r} (use um número inteiro).")
+
+
+def _normalizar_paciente(paciente):
+    # Só textos são aparados; outros valores seguem para _validar_operacao recusar
+    return (paciente.strip() or None) if isinstance(paciente, str) else paciente
+
+
+def _normalizar_operacao(operacao):
+    """Aceita um dicionário {"numero", "acao", "paciente", "versao"} ou uma tupla (numero, acao[, paciente])."""
+    if isinstance(operacao, dict):
+        versao = operacao.get("versao")
+        with contextlib.suppress(ValueError):  # Versão inválida: recusada por _validar_operacao
+            versao = versao_esperada(versao)
+        return (str(operacao.get("numero", "")).strip(), str(operacao.get("acao", "")).strip(),
+                _normalizar_paciente(operacao.get("paciente")), versao)
+    numero, acao, *resto = operacao
+    return str(numero).strip(), str(acao).strip(), _normalizar_paciente(resto[0] if resto else None), None
+
+
+def _validar_operacao(leitos, numero, acao, paciente, versao, simulados):
+    """Confere uma operação contra a máquina de estados sem alterar o leito.
+
+    `simulados` guarda (status, versao) dos leitos já tocados por operações
+    anteriores do lote; passe None para validar só os dados da operação.
+    """
+    if acao not in TRANSICOES:
+        return "acao_invalida", f"Ação '{acao}' desconhecida."
+    if paciente is not None and not isinstance(paciente, str):
+        return "paciente_invalido", f"Paciente inválido para o leito {numero}: {paciente!r} (use um texto)."
+    if acao == "ocupar" and not paciente:
+        return "paciente_ausente", f"Informe o paciente para ocupar o leito {numero}."
+    if versao is not None and not isinstance(versao, int):
+        return "versao_invalida", f"Versão inválida para o leito {numero}: {versao!r} (use um número inteiro)."
+    if simulados is None:
+        return None, None
+    leito = encontrar_leito(leitos, numero)
+    if not leito:
+        return "nao_encontrado", f"Leito {numero} não encontrado."
+    status, versao_atual = simulados.get(numero, (leito["status"], _versao(leito)))
+    if versao is not None and versao != versao_atual:
+        return "conflito", f"Conflito: leito {numero} estará na versão {versao_atual}, não {versao}."
+    origens, novo_status, recusa = TRANSICOES[acao]
+    if status not in origens:
+        return "status_invalido", f"Leito {numero} {recusa}. Status atual: {status}."
+    simulados[numero] = (novo_status, versao_atual + 1)
+    return None, None
+
+
+@_medido("aplicar_lote")
+def aplicar_lote(leitos, operacoes, tudo_ou_nada=False):
+    """Aplica uma lista de transições em uma única transação do armazenamento.
+
+    Cada operação é (numero, acao[, paciente]) ou um dicionário com essas chaves
+    (e "versao" opcional), com `acao` em TRANSICOES. As alterações são gravadas
+    juntas no diário ou no banco ao final do lote. Com tudo_ou_nada=True, o lote
+    inteiro é validado antes de qualquer alteração e, se uma operação falhar,
+    nenhuma é aplicada. Retorna uma lista com o resultado de cada operação.
+    """
+    operacoes = [_normalizar_operacao(operacao) for operacao in operacoes]
+    resultados = []
+    with _transacao(leitos):
+        falhas = {}
+        if tudo_ou_nada:
+            banco = getattr(leitos, "banco", None)
+            if banco:
+                # A simulação parte do estado gravado por outros processos, não do que está em memória
+                # (no diário, a transação externa já trouxe esses eventos)
+                for numero in dict.fromkeys(numero for numero, _, _, _ in operacoes):
+                    banco._atualizar_da_base(leitos, numero)
+            simulados = {}
+            for indice, (numero, acao, paciente, versao) in enumerate(operacoes):
+                erro, mensagem = _validar_operacao(leitos, numero, acao, paciente, versao, simulados)
+                if erro:
+                    falhas[indice] = (erro, mensagem)
+        for indice, (numero, acao, paciente, versao) in enumerate(operacoes):
+            if falhas:
+                erro, mensagem = falhas.get(indice, ("lote_cancelado", "Não aplicada: o lote tem operações inválidas."))
+                resultado = {"sucesso": False, "erro": erro, "mensagem": mensagem}
+            else:
+                erro, mensagem = _validar_operacao(leitos, numero, acao, paciente, versao, None)
+                if erro:
+                    resultado = {"sucesso": False, "erro": erro, "mensagem": mensagem}
+                else:
+                    resultado = executar_transicao(leitos, numero, acao, paciente, versao)
+            resultados.append(dict(resultado, indice=indice, numero=numero, acao=acao))
+    return resultados
+
+
+# Rede de hospitais: um arquivo (fragmento) por unidade/ala
+
+class RedeLeitos:
+    """Leitos de vários hospitais e alas, guardados em um arquivo por ala.
+
+    O fragmento de um leito é a parte do número antes do leito ("HOSP1/UTI"
+    para "HOSP1/UTI/12"), gravado em `diretorio/HOSP1/UTI.json` (ou .db).
+    Cada fragmento é um RegistroLeitos comum, com seu próprio diário e trava,
+    carregado na primeira vez que é usado e salvo de forma independente; leitos
+    com número simples ficam em `diretorio/_geral.json`. Consultas na rede
+    inteira rodam em paralelo, um fragmento por tarefa, e os resultados são
+    juntados em ordem.
+    """
+
+    def __init__(self, diretorio="leitos", extensao=".json", diario=True, max_tarefas=None):
+        self.diretorio = diretorio
+        self.extensao = extensao
+        self.diario = diario
+        self._fragmentos = {}
+        self._travas = {}
+        self._trava = threading.Lock()
+        # Threads: os fragmentos ficam na memória deste processo; a leitura de
+        # arquivos e as consultas do SQLite liberam o GIL enquanto esperam
+        self._executor = ThreadPoolExecutor(max_workers=max_tarefas, thread_name_prefix="rede")
+
+    def _arquivo(self, nome):
+        if not nome:
+            return os.path.join(self.diretorio, "_geral" + self.extensao)
+        return os.path.join(self.diretorio, *nome.split(SEPARADOR_NUMERO)) + self.extensao
+
+    def nomes(self):
+        """Fragmentos existentes no disco ou já carregados."""
+        nomes = set(self._fragmentos)
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for arquivo in arquivos:
+                if arquivo.endswith(self.extensao):
+                    caminho = os.path.relpath(os.path.join(raiz, arquivo[:-len(self.extensao)]), self.diretorio)
+                    nome = caminho.replace(os.sep, SEPARADOR_NUMERO)
+                    nomes.add("" if nome == "_geral" else nome)
+        return sorted(nomes, key=_chave_ordenacao)
+
+    def fragmento(self, nome):
+        """RegistroLeitos do fragmento `nome`, carregado do disco na primeira vez."""
+        registro = self._fragmentos.get(nome)
+        if registro is not None:
+            return registro
+        with self._trava:
+            trava = self._travas.setdefault(nome, threading.Lock())
+        with trava:  # Só uma tarefa carrega cada fragmento
+            registro = self._fragmentos.get(nome)
+            if registro is None:
+                arquivo = self._arquivo(nome)
+                os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+                registro = carregar_leitos(arquivo)
+                if self.diario and registro.banco is None:
+                    ativar_diario(registro, arquivo)
+                self._fragmentos[nome] = registro
+        return registro
+
+    def fragmento_do_leito(self, numero):
+        return self.fragmento(fragmento_do_leito(numero))
+
+    def obter(self, numero):
+        return self.fragmento_do_leito(numero).obter(numero)
+
+    def adicionar_leito(self, numero):
+        return adicionar_leito(self.fragmento_do_leito(numero), numero)
+
+    def remover_leito(self, numero, confirmar=False):
+        return remover_leito(self.fragmento_do_leito(numero), numero, confirmar)
+
+    def executar_transicao(self, numero, acao, paciente=None, versao_esperada=None):
+        return executar_transicao(self.fragmento_do_leito(numero), numero, acao, paciente, versao_esperada)
+
+    def consultar(self, funcao, *args, nomes=None):
+        """Aplica funcao(registro, *args) a cada fragmento, em paralelo. Retorna {nome: resultado}."""
+        nomes = self.nomes() if nomes is None else list(nomes)
+        resultados = self._executor.map(lambda nome: funcao(self.fragmento(nome), *args), nomes)
+        return dict(zip(nomes, resultados))
+
+    def leitos_por_status(self, status, nomes=None):
+        """Leitos no status informado em toda a rede (ou nos fragmentos `nomes`), em ordem."""
+        listas = self.consultar(leitos_por_status, status, nomes=nomes).values()
+        return list(heapq.merge(*listas, key=lambda leito: _chave_ordenacao(leito["numero"])))
+
+    def leitos_livres(self, nomes=None):
+        """Leitos livres (Disponível ou Leito Pronto) em qualquer lugar da rede, em ordem."""
+        def livres(registro):
+            return _leitos_ordenados([leito for status in STATUS_LIVRES for leito in leitos_por_status(registro, status)])
+        listas = self.consultar(livres, nomes=nomes).values()
+        return list(heapq.merge(*listas, key=lambda leito: _chave_ordenacao(leito["numero"])))
+
+    def resumo(self, nomes=None):
+        """resumo_ocupacao() de cada fragmento e o total da rede."""
+        por_fragmento = self.consultar(resumo_ocupacao, nomes=nomes)
+        total = {"total": 0, "livres": 0, "ocupados": 0, "por_status": {}}
+        for resumo in por_fragmento.values():
+            for chave in ("total", "livres", "ocupados"):
+                total[chave] += resumo[chave]
+            for status, quantidade in resumo["por_status"].items():
+                total["por_status"][status] = total["por_status"].get(status, 0) + quantidade
+        return {"rede": total, "fragmentos": por_fragmento}
+
+    def salvar(self, nomes=None):
+        """Salva os fragmentos carregados (ou só os informados), cada um no seu arquivo."""
+        nomes = list(self._fragmentos) if nomes is None else [nome for nome in nomes if nome in self._fragmentos]
+        list(self._executor.map(lambda nome: salvar_leitos(self._fragmentos[nome], self._arquivo(nome)), nomes))
+
+    def fechar(self):
+        """Salva os fragmentos carregados e encerra as tarefas e os diários."""
+        self.salvar()
+        for registro in self._fragmentos.values():
+            if registro.diario:
+                registro.diario.fechar()
+            if registro.banco:
+                registro.banco.fechar()
+        self._executor.shutdown()
+
+
+# Cache de exibição (telas visualizar_* e resultados da busca)
+
+# Linhas acumuladas antes de cada escrita no terminal
+BLOCO_SAIDA = 10000
+
+
+def _partes_fixas(leito):
+    """Partes das linhas de um leito que só mudam em transições:
+    (linha do quadro, linha da busca, linha dos ocupados, entrada_ocupacao para o tempo decorrido)."""
+    numero, status, paciente = leito["numero"], leito["status"], leito["paciente"]
+    linha = f"Leito {numero}: {status}"
+    if not paciente:  # Caso mais comum: as três telas usam a mesma linha
+        return linha, linha, linha, None
+    entrada = leito["entrada_ocupacao"] if status == "Ocupado" else None
+    com_paciente = f"{linha} - Paciente: {paciente}"
+    return (com_paciente if entrada else linha, com_paciente, f"Leito {numero} - Paciente: {paciente}", entrada)
+
+
+def _linhas_leitos(leitos, selecionados, campo, rotulo_tempo):
+    """Linhas de exibição dos leitos `selecionados`.
+
+    As partes fixas ficam guardadas no RegistroLeitos (descartadas a cada
+    transição do leito); os tempos de ocupação são calculados numa única
+    passada, com um só datetime.now() para a tela inteira.
+    """
+    cache = leitos._linhas if isinstance(leitos, RegistroLeitos) else {}
+    partes = []
+    for leito in selecionados:
+        parte = cache.get(leito["numero"])
+        if parte is None:
+            parte = cache[leito["numero"]] = _partes_fixas(leito)
+        partes.append(parte)
+    agora = datetime.now()
+    linhas = []
+    for parte in partes:
+        entrada = parte[3]
+        if entrada is None:
+            linhas.append(parte[campo])
         else:
-            print(f"Leito {numero_str} não está em manutenção. Status atual: {leito['status']}.")
-        return
-    print(f"Leito {numero_str} não encontrado.")
+            horas, minutos = divmod((agora - entrada).total_seconds(), 3600)
+            linhas.append(f"{parte[campo]} ({rotulo_tempo} {int(horas)}h {int(minutos)}min)")
+    return linhas
+
+
+def _texto_historico(h):
+    """Linha de exibição de uma entrada do histórico."""
+    t = _para_datetime(h["timestamp"])  # Entradas ainda adiadas vêm com o texto ISO
+    # Mesmo formato de strftime('%d/%m/%Y %H:%M:%S'), várias vezes mais rápido
+    msg = "  Status alterado de '%s' para '%s' em: %02d/%02d/%04d %02d:%02d:%02d" % (
+        h["status_anterior"], h["novo_status"], t.day, t.month, t.year, t.hour, t.minute, t.second)
+    if h.get("paciente"):
+        msg += f" (Paciente: {h['paciente']})"
+    if h.get("tempo_permanencia"):
+        msg += f" (Permanência: {h['tempo_permanencia']})"
+    return msg
+
+
+# Linhas de histórico formatadas mantidas em memória (somando todos os leitos)
+LIMITE_LINHAS_HISTORICO = 500000
+
+
+class _CacheHistorico:
+    """Linhas de exibição do histórico já formatadas, por leito, com descarte LRU.
+
+    O histórico só cresce: a cada exibição, só as entradas novas do leito são
+    formatadas. Quando o total passa de `limite`, saem os blocos dos leitos
+    exibidos há mais tempo.
+    """
+
+    def __init__(self, limite=LIMITE_LINHAS_HISTORICO):
+        self.limite = limite
+        self._blocos = OrderedDict()  # numero -> linhas, uma por entrada do histórico
+        self._total = 0
+
+    def linhas(self, leito):
+        numero, historico = leito["numero"], leito["historico"]
+        bloco = self._blocos.get(numero)
+        if bloco is None or len(bloco) > len(historico):
+            self.descartar(numero)
+            bloco = self._blocos[numero] = []
+        else:
+            self._blocos.move_to_end(numero)
+        if len(bloco) < len(historico):
+            # Só a cauda ainda não formatada: o histórico sob demanda não fica em memória
+            # e o adiado não é convertido
+            novas = [_texto_historico(h) for h in _entradas_desde(historico, len(bloco))]
+            bloco.extend(novas)
+            self._total += len(novas)
+            while self._total > self.limite and len(self._blocos) > 1:
+                _, antigo = self._blocos.popitem(last=False)
+                self._total -= len(antigo)
+        return bloco
+
+    def descartar(self, numero):
+        bloco = self._blocos.pop(numero, None)
+        if bloco:
+            self._total -= len(bloco)
+
+
+def _escrever(linhas):
+    """Exibe as linhas com uma única escrita no terminal."""
+    if linhas:
+        print("\n".join(linhas))
 
 
 # Funções de visualização 
 
+@_medido("visualizar_leitos")
 def visualizar_leitos(leitos):
     """Exibe o status atual de todos os leitos."""
     print("\n--- Status dos Leitos ---")
@@ -244,61 +2832,53 @@ def visualizar_leitos(leitos):
         return
 
     # Garante que os leitos sejam exibidos em ordem numérica
-    leitos_ordenados = sorted(leitos, key=lambda x: int(x['numero']))
-
-    for leito in leitos_ordenados:
-        status = leito["status"]
-        paciente_info = ""
-        tempo_info = ""
-        if leito["status"] == "Ocupado" and leito["entrada_ocupacao"]:
-            paciente_info = f" - Paciente: {leito['paciente']}"
-            agora = datetime.now()
-            tempo_decorrido = agora - leito["entrada_ocupacao"]
-            horas, minutos = divmod(tempo_decorrido.total_seconds(), 3600)
-            tempo_info = f" (há {int(horas)}h {int(minutos)}min)"
-
-        print(f"Leito {leito['numero']}: {status}{paciente_info}{tempo_info}")
+    _escrever(_linhas_leitos(leitos, _leitos_ordenados(leitos), 0, "há"))
 
 
+@_medido("visualizar_leitos_ocupados")
 def visualizar_leitos_ocupados(leitos):
     """Exibe apenas os leitos atualmente ocupados, com tempo de permanência."""
     print("\n--- Leitos Ocupados ---")
-    ocupados = [leito for leito in leitos if leito["status"] == "Ocupado"]
+    ocupados = leitos_ocupados(leitos)  # Já em ordem numérica
     if not ocupados:
         print("Nenhum leito ocupado no momento.")
     else:
-        # Garante que os leitos ocupados sejam exibidos em ordem numérica
-        ocupados_ordenados = sorted(ocupados, key=lambda x: int(x['numero']))
-        for leito in ocupados_ordenados:
-            agora = datetime.now()
-            tempo_decorrido = agora - leito["entrada_ocupacao"]
-            horas, minutos = divmod(tempo_decorrido.total_seconds(), 3600)
-            print(f"Leito {leito['numero']} - Paciente: {leito['paciente']} (Há {int(horas)}h {int(minutos)}min)")
+        _escrever(_linhas_leitos(leitos, ocupados, 2, "Há"))
 
 
-def visualizar_historico(leitos):
-    """Exibe o histórico detalhado de ocupação e liberação/mudanças de status de cada leito."""
+@_medido("visualizar_historico")
+def visualizar_historico(leitos, incluir_arquivado=False, arquivo=None):
+    """Exibe o histórico detalhado de ocupação e liberação/mudanças de status de cada leito.
+    Com incluir_arquivado=True, as entradas do arquivo morto aparecem antes das atuais."""
     print("\n--- Histórico de Leitos ---")
     if not leitos:
         print("Nenhum leito cadastrado para histórico.")
         return
 
     # Garante que os leitos sejam exibidos em ordem numérica
-    leitos_ordenados = sorted(leitos, key=lambda x: int(x['numero']))
-
+    leitos_ordenados = _leitos_ordenados(leitos)
+
+    # As linhas são escritas em blocos de BLOCO_SAIDA, não uma a uma
+    cache = leitos.cache_historico() if isinstance(leitos, RegistroLeitos) else None
+    arquivadas = {}  # numero -> linhas das entradas arquivadas
+    if incluir_arquivado:
+        for numero, h in ler_arquivo_morto(_arquivo_dos_leitos(leitos, arquivo)):
+            arquivadas.setdefault(numero, []).append(_texto_historico(h))
+    linhas = []
     for leito in leitos_ordenados:
-        print(f"\nLeito {leito['numero']}:")
+        linhas.append(f"\nLeito {leito['numero']}:")
+        linhas.extend(arquivadas.get(leito["numero"], ()))
         if leito["historico"]:
-            for h in leito["historico"]:
-                timestamp_str = h["timestamp"].strftime('%d/%m/%Y %H:%M:%S')
-                msg = f"  Status alterado de '{h['status_anterior']}' para '{h['novo_status']}' em: {timestamp_str}"
-                if h.get("paciente"):
-                    msg += f" (Paciente: {h['paciente']})"
-                if h.get("tempo_permanencia"):
-                    msg += f" (Permanência: {h['tempo_permanencia']})"
-                print(msg)
-        else:
-            print("  Nenhum histórico registrado.")
+            if cache is None:
+                linhas.extend(_texto_historico(h) for h in leito["historico"])
+            else:
+                linhas.extend(cache.linhas(leito))
+        elif leito["numero"] not in arquivadas:
+            linhas.append("  Nenhum histórico registrado.")
+        if len(linhas) >= BLOCO_SAIDA:
+            _escrever(linhas)
+            linhas = []
+    _escrever(linhas)
 
 
 def buscar_leitos(leitos):
@@ -306,10 +2886,11 @@ def buscar_leitos(leitos):
     print("\n--- Buscar Leitos ---")
     criterio = input("Buscar por (número/status/paciente): ").strip().lower()
     resultados = []
+    anteriores = []  # Internações já encerradas (busca por paciente)
 
     if criterio == "numero":
         num_busca = input("Digite o número do leito: ").strip()
-        if not num_busca.isdigit():
+        if not numero_valido(num_busca):
             print("Número de leito inválido.")
             return
         leito = encontrar_leito(leitos, num_busca) # num_busca já é string e limpo
@@ -317,34 +2898,49 @@ def buscar_leitos(leitos):
             resultados.append(leito)
     elif criterio == "status":
         status_busca = input("Digite o status (Disponível, Ocupado, Em Limpeza, Em Manutenção, Leito Pronto): ").strip()
-        resultados = [leito for leito in leitos if leito["status"].lower() == status_busca.lower()]
+        resultados = leitos_por_status(leitos, status_busca)
     elif criterio == "paciente":
-        paciente_busca = input("Digite o nome do paciente: ").strip().lower()
-        resultados = [leito for leito in leitos if
-                      leito["paciente"] and paciente_busca in leito["paciente"].lower()]
+        paciente_busca = input("Digite o nome do paciente: ").strip()
+        estadias = buscar_pacientes(leitos, paciente_busca)
+        resultados = [leito for leito in (encontrar_leito(leitos, e["numero"]) for e in estadias if e["fim"] is None)
+                      if leito]
+        anteriores = [e for e in estadias if e["fim"] is not None]
     else:
         print("Critério de busca inválido.")
         return
 
     if resultados:
         print("\n--- Resultados da Busca ---")
-        resultados_ordenados = sorted(resultados, key=lambda x: int(x['numero']))
-        for leito in resultados_ordenados:
-            status = leito["status"]
-            paciente_info = f" - Paciente: {leito['paciente']}" if leito["paciente"] else ""
-            tempo_info = ""
-            if leito["status"] == "Ocupado" and leito["entrada_ocupacao"]:
-                agora = datetime.now()
-                tempo_decorrido = agora - leito["entrada_ocupacao"]
-                horas, minutos = divmod(tempo_decorrido.total_seconds(), 3600)
-                tempo_info = f" (há {int(horas)}h {int(minutos)}min)"
-            print(f"Leito {leito['numero']}: {status}{paciente_info}{tempo_info}")
-    else:
+        _escrever(_linhas_leitos(leitos, _leitos_ordenados(resultados), 1, "há"))
+    elif not anteriores:
         print("Nenhum leito encontrado com o critério especificado.")
 
+    if anteriores:
+        print("\n--- Internações Anteriores ---")
+        linhas = []
+        for estadia in anteriores:
+            entrada = estadia["inicio"].strftime('%d/%m/%Y %H:%M') if estadia["inicio"] else "?"
+            saida = estadia["fim"].strftime('%d/%m/%Y %H:%M')
+            linhas.append(f"Leito {estadia['numero']}: {estadia['paciente']} de {entrada} a {saida}")
+        _escrever(linhas)
+
+
+def _visualizar_historico_interativo(leitos):
+    """visualizar_historico no menu: pergunta pelo arquivo morto só quando ele existe."""
+    incluir = False
+    if os.path.isdir(_diretorio_arquivo_morto(_arquivo_dos_leitos(leitos))):
+        incluir = input("Incluir histórico arquivado? (s/n): ").strip().lower() == "s"
+    visualizar_historico(leitos, incluir)
+
 
 # Funções de autenticação
 
+def credenciais_validas(tipo, usuario, senha):
+    """Confere usuário e senha de um 'enfermeiro' ou 'paciente'."""
+    credenciais = ENFERMEIRO_CREDENCIAIS if tipo == 'enfermeiro' else PACIENTE_CREDENCIAIS
+    return usuario in credenciais and credenciais[usuario] == senha
+
+
 def login_usuario():
     """Realiza o processo de login e retorna o tipo de usuário e nome."""
     while True:
@@ -357,13 +2953,13 @@ def login_usuario():
         senha = input(f"Digite sua senha: ").strip()
 
         if tipo == 'enfermeiro':
-            if usuario in ENFERMEIRO_CREDENCIAIS and ENFERMEIRO_CREDENCIAIS[usuario] == senha:
+            if credenciais_validas(tipo, usuario, senha):
                 print(f"Enfermeiro {usuario} logado com sucesso!")
                 return tipo, usuario
             else:
                 print("Nome de usuário ou senha de enfermeiro inválidos.")
         elif tipo == 'paciente':
-            if usuario in PACIENTE_CREDENCIAIS and PACIENTE_CREDENCIAIS[usuario] == senha:
+            if credenciais_validas(tipo, usuario, senha):
                 print(f"Paciente {usuario} logado com sucesso!")
                 return tipo, usuario
             else:
@@ -374,7 +2970,16 @@ def login_usuario():
 # Função principal
 
 def main():
+    # Instrumentação opcional: SPRINT_METRICAS=arquivo.json grava as métricas
+    # periodicamente (a cada SPRINT_METRICAS_INTERVALO segundos, padrão 60)
+    arquivo_metricas = os.environ.get("SPRINT_METRICAS")
+    if arquivo_metricas:
+        ativar_metricas().gravar_periodicamente(arquivo_metricas,
+                                                float(os.environ.get("SPRINT_METRICAS_INTERVALO", 60)))
+
     leitos = carregar_leitos()
+    # SPRINT_HISTORICO_SEPARADO=1 grava o histórico em arquivos por leito a partir do próximo salvamento
+    escolher_historico_separado(leitos)
 
     # Inicializa alguns leitos se o arquivo estiver vazio
     if not leitos:
@@ -383,6 +2988,17 @@ def main():
             adicionar_leito(leitos, str(i)) # Garante que o número seja string
         salvar_leitos(leitos)  # Salva os leitos iniciais
 
+    # Cada transição passa a ser gravada no diário assim que acontece
+    # (no SQLite, o próprio banco já grava cada transição)
+    if leitos.banco is None:
+        ativar_diario(leitos)
+
+    # Retenção opcional do histórico: SPRINT_RETENCAO_DIAS e/ou SPRINT_RETENCAO_MAXIMO
+    # (entradas por leito) movem o histórico antigo para o arquivo morto ao iniciar
+    dias, maximo = os.environ.get("SPRINT_RETENCAO_DIAS"), os.environ.get("SPRINT_RETENCAO_MAXIMO")
+    if dias or maximo:
+        arquivar_historico(leitos, dias=float(dias) if dias else None, maximo=int(maximo) if maximo else None)
+
     tipo_usuario, usuario_logado = login_usuario()
 
     while True:
@@ -409,58 +3025,62 @@ def main():
             print("5. Sair")
 
         opcao = input("Escolha uma opção: ").strip().lower()
+        consultas = ('9', '10', '11', '12') if tipo_usuario == 'enfermeiro' else ('1', '2', '3', '4')
 
         try:
+            if opcao in consultas:
+                # As consultas não passam por uma transação: traz antes o que outros operadores gravaram
+                leitos.sincronizar()
             if tipo_usuario == 'enfermeiro':
                 if opcao == '1':
                     numero = input("Digite o número do novo leito: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         adicionar_leito(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '2':
                     numero = input("Digite o número do leito a ser removido: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         remover_leito(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '3':
                     numero = input("Digite o número do leito a ser ocupado: ").strip()
                     paciente = input("Digite o nome do paciente: ").strip()
-                    if numero.isdigit() and paciente:
+                    if numero_valido(numero) and paciente:
                         ocupar_leito(leitos, numero, paciente)
                     else:
                         print("Entrada inválida. Verifique o número do leito e o nome do paciente.")
                 elif opcao == '4':
                     numero = input("Digite o número do leito a ser liberado: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         liberar_leito(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '5':
                     numero = input("Digite o número do leito para iniciar a limpeza: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         iniciar_limpeza(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '6':
                     numero = input("Digite o número do leito para finalizar a limpeza: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         finalizar_limpeza(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '7':
                     numero = input("Digite o número do leito para iniciar a manutenção: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         iniciar_manutencao(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '8':
                     numero = input("Digite o número do leito para finalizar a manutenção: ").strip()
-                    if numero.isdigit():
+                    if numero_valido(numero):
                         finalizar_manutencao(leitos, numero)
                     else:
-                        print("Número de leito inválido. Por favor, digite apenas dígitos.")
+                        print(MENSAGEM_NUMERO_INVALIDO)
                 elif opcao == '9':
                     buscar_leitos(leitos)
                 elif opcao == '10':
@@ -468,7 +3088,7 @@ def main():
                 elif opcao == '11':
                     visualizar_leitos_ocupados(leitos)
                 elif opcao == '12':
-                    visualizar_historico(leitos)
+                    _visualizar_historico_interativo(leitos)
                 elif opcao == '13':
                     salvar_leitos(leitos)
                     print("Saindo do sistema...")
@@ -483,7 +3103,7 @@ def main():
                 elif opcao == '3':
                     visualizar_leitos_ocupados(leitos)
                 elif opcao == '4':
-                    visualizar_historico(leitos)
+                    _visualizar_historico_interativo(leitos)
                 elif opcao == '5':
                     salvar_leitos(leitos)
                     print("Saindo do sistema...")
@@ -491,8 +3111,11 @@ def main():
                 else:
                     print("Opção inválida. Tente novamente.")
         except Exception as e:
+            _registrar_erro("menu", e)
             print(f"Ocorreu um erro inesperado: {e}")
 
 
 if __name__ == "__main__":
-    main()
+    # SPRINT_PERFIL=sessao.prof perfila a sessão inteira com cProfile
+    with perfil_sessao(os.environ.get("SPRINT_PERFIL")):
+        main()